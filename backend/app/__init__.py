@@ -12,10 +12,16 @@ def create_app():
     # Esto es crucial para que url_for genere URLs https y con la ruta correcta en cPanel/Nginx
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
     
-    # Ruta absoluta a backend/sqlite.db
+    # Ruta absoluta a backend/sqlite.db (DATABASE_PATH permite usar otro archivo, p. ej. una copia en las pruebas)
     base_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-    db_path = os.path.join(base_dir, 'sqlite.db')
+    db_path = os.getenv('DATABASE_PATH') or os.path.join(base_dir, 'sqlite.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    # Engine de solo lectura para las vistas @read_only (ver app/extensions.py). Por defecto el mismo
+    # archivo abierto con mode=ro; DATABASE_READ_URI permite apuntar a una réplica.
+    from .extensions import READ_BIND
+    app.config['SQLALCHEMY_BINDS'] = {
+        READ_BIND: os.getenv('DATABASE_READ_URI') or f'sqlite:///file:{db_path}?mode=ro&uri=true'
+    }
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
@@ -27,7 +33,25 @@ def create_app():
     # y aquí habilitamos la extensión.
     CORS(app) 
     
+    # Perfil de SQLite (WAL, busy_timeout, pool...): ver app/db_profile.py
+    from . import db_profile
+    db_profile.configure(app)
     db.init_app(app)
+    db_profile.init_app(app)
+    _ensure_schema(app)
+
+    # Group commit opcional de inserciones de órdenes (ver app/write_queue.py)
+    from .write_queue import order_writes
+    order_writes.init_app(app, enabled=os.getenv('ORDER_GROUP_COMMIT') == '1')
+
+    # Canal SSE: reparto de live_messages a los clientes conectados a este worker (ver app/live_events.py)
+    from .live_events import broker
+    broker.init_app(app)
+
+    # Particionado caliente/frío: órdenes de eventos pasados en orders_archive.db (ver app/order_archive.py)
+    if os.getenv('ORDER_ARCHIVE') == '1':
+        from . import order_archive
+        order_archive.init_app(app)
 
     # Importación y registro de Blueprints
     from .routes.main import main
@@ -44,6 +68,8 @@ def create_app():
     # Los prefijos son RELATIVOS al punto de montaje de la aplicación.
     # Si la app se monta en /backendskipit, entonces /api/users será /backendskipit/api/users
     from .routes.webpay_routes import webpay_bp
+    from .routes.claim_routes import claim_bp
+    from .routes.live_routes import live_bp
 
     app.register_blueprint(main)
     app.register_blueprint(user_bp, url_prefix='/api/users')
@@ -56,5 +82,31 @@ def create_app():
     app.register_blueprint(media_bp, url_prefix='/media')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(webpay_bp, url_prefix='/api/webpay')
+    app.register_blueprint(claim_bp, url_prefix='/api/claims')
+    app.register_blueprint(live_bp, url_prefix='/api/live')
 
     return app
+
+
+def _ensure_schema(app):
+    # Crea las tablas e índices que falten en bases ya existentes (create_all no toca las que existen).
+    # Liberamos las conexiones al terminar para no dejar el archivo abierto (scripts que borran sqlite.db).
+    from . import models, search, manifest, redemption_ledger, sales_rollups  # noqa: F401
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            # create_all no agrega índices nuevos a tablas existentes
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=connection, checkfirst=True)
+            search.ensure_index(connection)
+            manifest.ensure_triggers(connection)
+            manifest.prune(connection)
+            # Acumulados del dashboard: triggers, y backfill la primera vez sobre una base con órdenes
+            sales_rollups.ensure_triggers(connection)
+            if sales_rollups.is_empty(connection) and connection.exec_driver_sql("SELECT 1 FROM orders LIMIT 1").first():
+                sales_rollups.rebuild(connection)
+            # Ledger de QRs agotados de este worker
+            redemption_ledger.ensure_unique(connection)
+            redemption_ledger.ledger.load(connection)
+        db.engine.dispose()
@@ -0,0 +1,215 @@
+"""Canje (claim) de productos comprados, para los escáneres de barra.
+
+Cada canje es un UPDATE condicional sobre order_items:
+
+    UPDATE order_items SET claimed = claimed + :n
+    WHERE id = :id AND claimed + :n <= quantity AND <orden canjeable>
+
+La condición y el incremento se evalúan en la misma sentencia, así que dos
+escáneres que leen el mismo QR al mismo tiempo nunca canjean de más: SQLite
+serializa las escrituras y el segundo UPDATE ve el `claimed` ya actualizado.
+El estado de la orden se recalcula dentro de la misma transacción, y lo que
+queda agotado se registra en el ledger de QRs canjeados (app/redemption_ledger.py).
+El nuevo estado se anuncia por el canal SSE en la misma transacción (app/live_events.py).
+"""
+from sqlalchemy import func, select, update
+
+from .live_events import publish_claims, publish_order_status
+from .models import Order, OrderItem, OrderStatus
+from .redemption_ledger import ledger, order_key, item_key
+
+CLAIMABLE_STATUSES = (OrderStatus.COMPLETED, OrderStatus.PARTIALLY_CLAIMED)
+
+
+class ClaimError(Exception):
+    def __init__(self, message, status_code=409, **details):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+    def to_dict(self):
+        return {'error': self.message, **self.details}
+
+
+def _claimable_orders(event_id=None):
+    query = select(Order.order_id).where(Order.status.in_(CLAIMABLE_STATUSES))
+    if event_id is not None:
+        query = query.where(Order.event_id == event_id)
+    return query
+
+
+def refresh_order_status(session, order_id):
+    """Deriva el estado de la orden a partir de lo canjeado en sus ítems."""
+    quantity, claimed = session.execute(
+        select(func.coalesce(func.sum(OrderItem.quantity), 0), func.coalesce(func.sum(OrderItem.claimed), 0))
+        .where(OrderItem.order_id == order_id)
+    ).one()
+
+    if quantity and claimed >= quantity:
+        status = OrderStatus.FULLY_CLAIMED
+    elif claimed > 0:
+        status = OrderStatus.PARTIALLY_CLAIMED
+    else:
+        status = OrderStatus.COMPLETED
+
+    session.execute(
+        update(Order)
+        .where(Order.order_id == order_id, Order.status.in_(CLAIMABLE_STATUSES + (OrderStatus.FULLY_CLAIMED,)))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    return status
+
+
+def _exhausted_keys(order_id, status, item_ids=()):
+    keys = [item_key(i) for i in item_ids]
+    if status == OrderStatus.FULLY_CLAIMED:
+        keys.append(order_key(order_id))
+    return keys
+
+
+def _announce(session, statuses):
+    """Publica el estado de cada orden canjeada ({order_id: status}) y el avance de canje de sus eventos."""
+    events = {}
+    for order_id, event_id in session.execute(
+        select(Order.order_id, Order.event_id).where(Order.order_id.in_(statuses))
+    ):
+        publish_order_status(session, order_id, event_id, statuses[order_id])
+        events.setdefault(event_id, []).append(order_id)
+    for event_id, order_ids in events.items():
+        publish_claims(session, event_id, order_ids)
+
+
+def _explain_rejection(session, order_id, event_id, item=None, quantity=None):
+    order = session.execute(
+        select(Order.status, Order.event_id).where(Order.order_id == order_id)
+    ).one_or_none()
+    if order is None:
+        return ClaimError('Order not found', 404)
+    if event_id is not None and order.event_id != event_id:
+        return ClaimError('Order belongs to another event', 409, event_id=order.event_id)
+    if order.status not in CLAIMABLE_STATUSES and order.status != OrderStatus.FULLY_CLAIMED:
+        return ClaimError('Order is not claimable', 409, status=order.status.value if order.status else None)
+    if item is not None:
+        return ClaimError('Not enough units left to claim', 409,
+                          remaining=item.quantity - (item.claimed or 0), requested=quantity)
+    return ClaimError('Order already fully claimed', 409)
+
+
+def _apply_item_claim(session, item_id, quantity, event_id):
+    """UPDATE condicional sin commit. Devuelve (order_id, quantity, claimed) o None si no se pudo canjear."""
+    return session.execute(
+        update(OrderItem)
+        .where(
+            OrderItem.id == item_id,
+            func.coalesce(OrderItem.claimed, 0) + quantity <= OrderItem.quantity,
+            OrderItem.order_id.in_(_claimable_orders(event_id))
+        )
+        .values(claimed=func.coalesce(OrderItem.claimed, 0) + quantity)
+        .returning(OrderItem.order_id, OrderItem.quantity, OrderItem.claimed)
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+
+
+def _explain_item_rejection(session, item_id, quantity, event_id):
+    item = session.execute(
+        select(OrderItem.order_id, OrderItem.quantity, OrderItem.claimed).where(OrderItem.id == item_id)
+    ).one_or_none()
+    if item is None:
+        return ClaimError('Order item not found', 404)
+    return _explain_rejection(session, item.order_id, event_id, item, quantity)
+
+
+def claim_item(session, item_id, quantity=1, event_id=None):
+    """Canjea `quantity` unidades de un ítem. Hace commit; lanza ClaimError si no se puede."""
+    if quantity <= 0:
+        raise ClaimError('quantity must be positive', 400)
+
+    row = _apply_item_claim(session, item_id, quantity, event_id)
+    if row is None:
+        session.rollback()
+        raise _explain_item_rejection(session, item_id, quantity, event_id)
+
+    status = refresh_order_status(session, row.order_id)
+    exhausted = [item_id] if row.claimed >= row.quantity else []
+    ledger.record(session, row.order_id, event_id, _exhausted_keys(row.order_id, status, exhausted))
+    _announce(session, {row.order_id: status})
+    session.commit()
+    return {
+        'order_id': row.order_id,
+        'item_id': item_id,
+        'claimed_now': quantity,
+        'claimed': row.claimed,
+        'remaining': row.quantity - row.claimed,
+        'status': status.value,
+    }
+
+
+def claim_batch(session, claims, event_id):
+    """Aplica un lote de canjes (p. ej. hechos offline) en una sola transacción.
+
+    Cada canje se acepta completo o se rechaza; nunca se canjea de más. Devuelve
+    un resultado por canje, en el mismo orden, para que el dispositivo concilie.
+    """
+    results = []
+    touched_orders = set()
+    exhausted = []
+    for claim in claims:
+        item_id, quantity = claim['item_id'], claim['quantity']
+        result = {'item_id': item_id, 'quantity': quantity}
+        if 'client_ref' in claim:
+            result['client_ref'] = claim['client_ref']
+
+        row = _apply_item_claim(session, item_id, quantity, event_id) if quantity > 0 else None
+        if row is None:
+            if quantity > 0:
+                error = _explain_item_rejection(session, item_id, quantity, event_id)
+            else:
+                error = ClaimError('quantity must be positive', 400)
+            result.update({'accepted': False, **error.to_dict()})
+        else:
+            touched_orders.add(row.order_id)
+            if row.claimed >= row.quantity:
+                exhausted.append(item_key(item_id))
+            result.update({'accepted': True, 'order_id': row.order_id, 'remaining': row.quantity - row.claimed})
+        results.append(result)
+
+    statuses = {order_id: refresh_order_status(session, order_id) for order_id in touched_orders}
+    for order_id, status in statuses.items():
+        exhausted += _exhausted_keys(order_id, status)
+    if exhausted:
+        ledger.record(session, None, event_id, exhausted)
+    if statuses:
+        _announce(session, statuses)
+    session.commit()
+    return results
+
+
+def claim_order(session, order_id, event_id=None):
+    """Canjea todo lo pendiente de una orden ("QR Global"). Hace commit; lanza ClaimError si no se puede."""
+    rows = session.execute(
+        update(OrderItem)
+        .where(
+            OrderItem.order_id == order_id,
+            func.coalesce(OrderItem.claimed, 0) < OrderItem.quantity,
+            OrderItem.order_id.in_(_claimable_orders(event_id))
+        )
+        .values(claimed=OrderItem.quantity)
+        .returning(OrderItem.id, OrderItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    if not rows:
+        session.rollback()
+        raise _explain_rejection(session, order_id, event_id)
+
+    status = refresh_order_status(session, order_id)
+    ledger.record(session, order_id, event_id, _exhausted_keys(order_id, status, [r.id for r in rows]))
+    _announce(session, {order_id: status})
+    session.commit()
+    return {
+        'order_id': order_id,
+        'items': [{'item_id': r.id, 'claimed': r.quantity, 'remaining': 0} for r in rows],
+        'status': status.value,
+    }
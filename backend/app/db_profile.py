@@ -0,0 +1,122 @@
+"""Perfil de rendimiento de SQLite (SQLITE_PROFILE), aplicado a cada conexión nueva.
+
+- legacy: el comportamiento original (journal de rollback, valores por defecto
+  de SQLite y del pool). Los lectores bloquean al escritor.
+- wal (por defecto): WAL, para que lectores y un escritor trabajen a la vez;
+  synchronous=NORMAL (un fsync por checkpoint, no por commit; ante un corte de
+  luz se pueden perder los últimos commits, nunca se corrompe la base);
+  busy_timeout para esperar el lock en vez de fallar con "database is locked";
+  cache de páginas y mmap más grandes, y temporales en memoria.
+- wal-safe: igual que wal pero con synchronous=FULL (fsync en cada commit).
+
+Los valores se pueden ajustar con SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB,
+SQLITE_MMAP_SIZE_MB, SQLITE_POOL_SIZE y SQLITE_MAX_OVERFLOW.
+"""
+import os
+
+from sqlalchemy import event
+
+from .extensions import db, READ_BIND
+
+PROFILES = {
+    'legacy': {
+        'pragmas': {'journal_mode': 'DELETE'},
+        'pool': {},
+    },
+    'wal': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -64000,         # en KiB (negativo) = 64 MB por conexión
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+    },
+}
+PROFILES['wal-safe'] = {
+    'pragmas': {**PROFILES['wal']['pragmas'], 'synchronous': 'FULL'},
+    'pool': PROFILES['wal']['pool'],
+}
+
+name = None
+pragmas = {}
+pool = {}
+
+
+def _overrides(profile):
+    result_pragmas = dict(profile['pragmas'])
+    result_pool = dict(profile['pool'])
+    if 'busy_timeout' in result_pragmas and os.getenv('SQLITE_BUSY_TIMEOUT_MS'):
+        result_pragmas['busy_timeout'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS'))
+    if 'cache_size' in result_pragmas and os.getenv('SQLITE_CACHE_SIZE_KB'):
+        result_pragmas['cache_size'] = -int(os.getenv('SQLITE_CACHE_SIZE_KB'))
+    if 'mmap_size' in result_pragmas and os.getenv('SQLITE_MMAP_SIZE_MB'):
+        result_pragmas['mmap_size'] = int(os.getenv('SQLITE_MMAP_SIZE_MB')) * 1024 * 1024
+    if result_pool and os.getenv('SQLITE_POOL_SIZE'):
+        result_pool['pool_size'] = int(os.getenv('SQLITE_POOL_SIZE'))
+    if result_pool and os.getenv('SQLITE_MAX_OVERFLOW'):
+        result_pool['max_overflow'] = int(os.getenv('SQLITE_MAX_OVERFLOW'))
+    return result_pragmas, result_pool
+
+
+def configure(app):
+    """Antes de db.init_app: elige el perfil y deja las opciones del pool en la config."""
+    global name, pragmas, pool
+    name = os.getenv('SQLITE_PROFILE', 'wal')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE '{name}' (expected one of {', '.join(PROFILES)})")
+    pragmas, pool = _overrides(PROFILES[name])
+
+    options = dict(pool)
+    if 'busy_timeout' in pragmas:
+        # pysqlite reintenta por su cuenta con este timeout; lo alineamos con busy_timeout
+        options['connect_args'] = {'timeout': pragmas['busy_timeout'] / 1000}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def init_app(app):
+    """Después de db.init_app: aplica los PRAGMA en cada conexión nueva del pool."""
+    with app.app_context():
+        event.listen(db.engine, 'connect', _apply_pragmas)
+        read_engine = db.engines.get(READ_BIND)
+        if read_engine is not None and read_engine.dialect.name == 'sqlite':
+            event.listen(read_engine, 'connect', _apply_read_pragmas)
+
+
+def _execute_pragmas(dbapi_connection, values):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in values.items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    _execute_pragmas(dbapi_connection, pragmas)
+
+
+def _apply_read_pragmas(dbapi_connection, connection_record):
+    # Una conexión de solo lectura no puede cambiar journal_mode; query_only bloquea cualquier escritura
+    values = {k: v for k, v in pragmas.items() if k != 'journal_mode'}
+    _execute_pragmas(dbapi_connection, {**values, 'query_only': 'ON'})
+
+
+def describe(connection):
+    """Perfil elegido y valores efectivos de cada PRAGMA (para /api/health)."""
+    effective = {
+        pragma: connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+        for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')
+    }
+    read_engine = db.engines.get(READ_BIND)
+    return {
+        'profile': name,
+        'pragmas': effective,
+        'read_engine': read_engine.url.render_as_string(hide_password=True) if read_engine else None,
+        'pool': {
+            'class': type(db.engine.pool).__name__,
+            'size': db.engine.pool.size() if hasattr(db.engine.pool, 'size') else None,
+            'checked_out': db.engine.pool.checkedout() if hasattr(db.engine.pool, 'checkedout') else None,
+            **{k: v for k, v in pool.items() if k != 'pool_size'},
+        },
+    }
@@ -1,3 +1,50 @@
+import contextlib
+import functools
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+# Bind del engine de solo lectura (ver create_app y read_only)
+READ_BIND = 'readonly'
+
+
+class RoutingSession(Session):
+    """Sesión que, dentro de una vista marcada con @read_only, usa el engine de solo lectura."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('db_read_only'):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@contextlib.contextmanager
+def reading_only():
+    """Dentro del bloque, db.session usa el engine de solo lectura; al salir se restaura el valor anterior."""
+    previous = g.get('db_read_only', False)
+    g.db_read_only = True
+    try:
+        yield
+    finally:
+        g.db_read_only = previous
+
+
+def read_only(view):
+    """Envía las consultas de db.session de esta vista al engine de solo lectura.
 
-db = SQLAlchemy()
+    Para lecturas largas (listados admin, dashboard, exportaciones): no ocupan
+    conexiones del pool que usan checkout y canjes. Una escritura dentro de la
+    vista falla con "attempt to write a readonly database". Las vistas que
+    transmiten la respuesta con un generador deben envolverlo en reading_only():
+    el generador corre después de que la vista retorna.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with reading_only():
+            return view(*args, **kwargs)
+    return wrapper
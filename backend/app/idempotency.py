@@ -0,0 +1,124 @@
+"""Idempotency-Key para los endpoints que crean órdenes o inician pagos.
+
+Los clientes móviles reintentan en redes inestables. Si la request trae el
+header `Idempotency-Key`, la primera ejecución reserva la clave en
+`idempotency_keys` y guarda su respuesta; los reintentos reciben esa misma
+respuesta (con `Idempotent-Replayed: true`) sin volver a ejecutar el handler.
+
+- Un duplicado concurrente espera (consultando la fila, sin escribir) hasta que
+  la primera request termine, o responde 409 tras WAIT_TIMEOUT segundos.
+- La misma clave con otro cuerpo es un error del cliente: 422.
+- Las respuestas 5xx no se guardan: la clave se libera y el reintento se ejecuta.
+- Las claves vencen tras IDEMPOTENCY_TTL segundos y se borran al reservar otras.
+"""
+import functools
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import IdempotencyKey
+
+TTL = timedelta(seconds=int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600)))
+WAIT_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+# Una reserva sin respuesta más antigua que esto se considera abandonada (worker caído)
+STALE_AFTER = timedelta(seconds=120)
+MAX_KEY_LENGTH = 255
+
+
+def _key_filter(scope, key):
+    return (IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+
+
+def _load(scope, key):
+    with db.engine.connect() as connection:
+        return connection.execute(select(IdempotencyKey.__table__).where(*_key_filter(scope, key))).first()
+
+
+def _reserve(scope, key, request_hash):
+    """Reserva la clave para esta request. Devuelve None si la reservó, o la fila existente."""
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+        connection.execute(delete(IdempotencyKey).where(
+            *_key_filter(scope, key),
+            IdempotencyKey.status_code.is_(None),
+            IdempotencyKey.created_at < now - STALE_AFTER
+        ))
+        inserted = connection.execute(
+            sqlite_insert(IdempotencyKey)
+            .values(scope=scope, key=key, request_hash=request_hash, created_at=now, expires_at=now + TTL)
+            .on_conflict_do_nothing()
+        ).rowcount
+        if inserted:
+            return None
+        return connection.execute(select(IdempotencyKey.__table__).where(*_key_filter(scope, key))).first()
+
+
+def _store(scope, key, response):
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(IdempotencyKey)
+            .where(*_key_filter(scope, key))
+            .values(status_code=response.status_code, mimetype=response.mimetype, body=response.get_data())
+        )
+
+
+def _release(scope, key):
+    with db.engine.begin() as connection:
+        connection.execute(delete(IdempotencyKey).where(*_key_filter(scope, key), IdempotencyKey.status_code.is_(None)))
+
+
+def _replay(row):
+    response = current_app.response_class(row.body, status=row.status_code, mimetype=row.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """Decorador de vistas POST que respeta el header Idempotency-Key (sin header, no hace nada)."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+            request_hash = hashlib.sha256(request.get_data()).hexdigest()
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while True:
+                row = _reserve(scope, key, request_hash)
+                if row is None:
+                    break
+                if row.request_hash != request_hash:
+                    return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+                while row is not None and row.status_code is None and time.monotonic() < deadline:
+                    time.sleep(POLL_INTERVAL)
+                    row = _load(scope, key)
+                if row is None:
+                    # La primera request falló y liberó la clave: esta la vuelve a intentar
+                    continue
+                if row.status_code is not None:
+                    return _replay(row)
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                _release(scope, key)
+                raise
+            if response.status_code >= 500 or response.is_streamed:
+                _release(scope, key)
+            else:
+                _store(scope, key, response)
+            return response
+        return wrapper
+    return decorator
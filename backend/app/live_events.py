@@ -0,0 +1,269 @@
+"""Canal de push por Server-Sent Events (GET /api/live/stream).
+
+Reemplaza el polling del dashboard admin y el de la pantalla de pago
+(`GET /api/orders/<id>` hasta que Webpay cambie el estado). Tópicos:
+
+- `dashboard`: contadores del dashboard tras cada compra o cambio de estado.
+- `order:<order_id>`: estado de una orden (creación, Webpay, canjes).
+- `event:<event_id>`: avance de canje del evento (vendido vs canjeado).
+
+`publish` inserta el mensaje en `live_messages` dentro de la transacción del
+cambio que anuncia: si esa transacción hace rollback, el mensaje no existe.
+Así funciona con varios procesos: un hilo por worker lee las filas nuevas por
+`seq` (solo mientras tenga clientes conectados) y las reparte a las colas de
+sus suscriptores.
+
+Cada cliente tiene una cola acotada (QUEUE_SIZE). Si se llena, el stream se
+cierra con un evento `overflow` y el cliente, al reconectar con el header
+`Last-Event-ID`, recibe lo pendiente desde la tabla (se conservan los últimos
+RETAIN mensajes). Los comentarios de heartbeat mantienen viva la conexión a
+través de proxies y detectan clientes caídos.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import delete, func, insert, select
+
+from . import db
+from .extensions import READ_BIND
+from .models import LiveMessage
+from .sales_rollups import dashboard_counters, event_progress
+
+ENABLED = os.getenv('LIVE_EVENTS', '1') == '1'
+POLL_INTERVAL = float(os.getenv('LIVE_POLL_MS', 200)) / 1000
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+QUEUE_SIZE = 100
+MAX_CLIENTS = int(os.getenv('LIVE_MAX_CLIENTS', 200))
+MAX_TOPICS = 10
+RETAIN = 10_000
+PRUNE_EVERY = 500
+POLL_BATCH = 1000
+
+DASHBOARD = 'dashboard'
+
+
+def order_topic(order_id):
+    return f'order:{order_id}'
+
+
+def event_topic(event_id):
+    return f'event:{event_id}'
+
+
+def parse_topics(raw):
+    """'dashboard,order:ORD-1,event:3' -> lista de tópicos. Lanza ValueError si alguno no es válido."""
+    topics = [t.strip() for t in (raw or '').split(',') if t.strip()]
+    if not topics or len(topics) > MAX_TOPICS:
+        raise ValueError(f'topics must list between 1 and {MAX_TOPICS} topics')
+    for topic in topics:
+        kind, _, key = topic.partition(':')
+        valid = (topic == DASHBOARD or (kind == 'order' and key)
+                 or (kind == 'event' and key.isdigit()))
+        if not valid:
+            raise ValueError(f"Invalid topic '{topic}'")
+    return list(dict.fromkeys(topics))
+
+
+def publish(executor, topic, data):
+    """Inserta el mensaje en la transacción de `executor` (Session o Connection); se envía al confirmarse."""
+    if not ENABLED:
+        return
+    seq = executor.execute(
+        insert(LiveMessage).values(topic=topic, data=json.dumps(data, separators=(',', ':'))).returning(LiveMessage.seq)
+    ).scalar()
+    if seq % PRUNE_EVERY == 0:
+        executor.execute(delete(LiveMessage).where(LiveMessage.seq <= seq - RETAIN))
+
+
+def publish_order_status(executor, order_id, event_id, status):
+    publish(executor, order_topic(order_id), {
+        'order_id': order_id,
+        'event_id': event_id,
+        'status': status.value if status else None,
+    })
+
+
+def publish_dashboard(executor):
+    # Con LIVE_EVENTS=0 no se calculan los contadores: no suma consultas a la transacción de la compra
+    if not ENABLED:
+        return
+    # Se lee después de la escritura: los triggers de app/sales_rollups.py ya actualizaron los acumulados
+    publish(executor, DASHBOARD, dashboard_counters(executor))
+
+
+def publish_claims(executor, event_id, order_ids):
+    if not ENABLED:
+        return
+    publish(executor, event_topic(event_id), {
+        'event_id': event_id,
+        'order_ids': sorted(order_ids),
+        **event_progress(executor, event_id),
+    })
+
+
+class Subscriber:
+    def __init__(self, topics):
+        self.topics = topics
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+class Broker:
+    def __init__(self):
+        self.delivered = 0
+        self.overflows = 0
+        self._engine = None
+        self._subscribers = {}
+        self._count = 0
+        self._last_seq = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        with app.app_context():
+            # Solo lee live_messages: el engine de solo lectura no ocupa el pool de las escrituras
+            self._engine = db.engines.get(READ_BIND) or db.engine
+
+    def subscribe(self, topics, last_seq=None):
+        """Registra un cliente. Devuelve (subscriber, pendientes desde last_seq) o None si no hay cupo."""
+        with self._lock:
+            if self._count >= MAX_CLIENTS:
+                return None
+            if self._last_seq is None:
+                self._last_seq = self._max_seq()
+            subscriber = Subscriber(topics)
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscriber)
+            self._count += 1
+            self._wakeup.set()
+        self._ensure_thread()
+
+        backlog = []
+        if last_seq is not None:
+            # Lo que el cliente no alcanzó a recibir; el stream descarta lo que luego llegue repetido
+            with self._engine.connect() as connection:
+                backlog = connection.execute(
+                    select(LiveMessage.seq, LiveMessage.topic, LiveMessage.data)
+                    .where(LiveMessage.seq > last_seq, LiveMessage.topic.in_(topics))
+                    .order_by(LiveMessage.seq)
+                    .limit(QUEUE_SIZE)
+                ).all()
+        return subscriber, [tuple(row) for row in backlog]
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for topic in subscriber.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[topic]
+            self._count -= 1
+            if subscriber.overflowed:
+                self.overflows += 1
+            if not self._count:
+                # Sin clientes el hilo deja de consultar; el próximo parte desde el último seq de ese momento
+                self._wakeup.clear()
+                self._last_seq = None
+
+    def _max_seq(self):
+        with self._engine.connect() as connection:
+            return connection.execute(select(func.max(LiveMessage.seq))).scalar() or 0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name='live-events', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait()
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"LIVE_EVENTS poll error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    def _poll(self):
+        with self._lock:
+            last_seq = self._last_seq
+        if last_seq is None:
+            return
+        with self._engine.connect() as connection:
+            rows = connection.execute(
+                select(LiveMessage.seq, LiveMessage.topic, LiveMessage.data)
+                .where(LiveMessage.seq > last_seq)
+                .order_by(LiveMessage.seq)
+                .limit(POLL_BATCH)
+            ).all()
+        with self._lock:
+            if self._last_seq != last_seq:
+                # Se fueron todos los clientes mientras consultábamos
+                return
+            for seq, topic, data in rows:
+                for subscriber in self._subscribers.get(topic, ()):
+                    subscriber.offer((seq, topic, data))
+                    self.delivered += 1
+                self._last_seq = seq
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'clients': self._count,
+                'topics': len(self._subscribers),
+                'last_seq': self._last_seq,
+                'delivered': self.delivered,
+                'overflows': self.overflows,
+                'poll_interval_ms': POLL_INTERVAL * 1000,
+            }
+
+
+broker = Broker()
+
+
+def _format(seq, topic, data):
+    return f"id: {seq}\nevent: {topic}\ndata: {data}\n\n"
+
+
+def stream(subscriber, backlog, last_seq=None):
+    """Generador del cuerpo text/event-stream. Libera al suscriptor cuando el cliente se desconecta."""
+    last = last_seq or 0
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for seq, topic, data in backlog:
+            last = seq
+            yield _format(seq, topic, data)
+        if len(backlog) >= QUEUE_SIZE:
+            # Quedan más pendientes que una cola: el cliente reconecta desde el último que recibió
+            yield "event: overflow\ndata: {}\n\n"
+            return
+        while True:
+            if subscriber.overflowed:
+                # El cliente reconecta con Last-Event-ID y recupera lo perdido desde live_messages
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            try:
+                seq, topic, data = subscriber.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            if seq <= last:
+                continue
+            last = seq
+            yield _format(seq, topic, data)
+    finally:
+        broker.unsubscribe(subscriber)
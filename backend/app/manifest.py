@@ -0,0 +1,151 @@
+"""Manifiesto de canje offline para escáneres.
+
+Cada escáner descarga el manifiesto del evento (órdenes e ítems con saldo por
+canjear) y luego solo pide los cambios desde el último `seq` que conoce.
+
+Los cambios los registran triggers de SQLite en `manifest_changes` cada vez que
+se inserta un ítem, cambia su `claimed` o cambia el estado de su orden, así que
+cubren tanto el ORM como los UPDATE condicionales de app/claims.py. Cada fila
+trae el saldo absoluto del ítem: aplicar un cambio dos veces no tiene efecto.
+
+Retención: `changes_since` solo usa la última fila de cada ítem, así que
+`prune` (al iniciar cada worker) borra las filas reemplazadas por una posterior
+del mismo ítem y todas las de eventos que ya pasaron (iso_date anterior a ayer,
+por los eventos que terminan de madrugada) o que ya no existen. Archivar un
+evento (app/order_archive.py) borra también sus filas.
+"""
+import gzip
+from datetime import date, timedelta
+
+from flask import current_app, request
+from sqlalchemy import delete, event, func, select
+
+from .claims import CLAIMABLE_STATUSES
+from .models import Event, Order, OrderItem, ManifestChange
+
+# Estados guardados por SQLAlchemy (nombre del enum) con saldo canjeable
+_CLAIMABLE = ', '.join(f"'{s.name}'" for s in CLAIMABLE_STATUSES)
+
+_REMAINING = f"CASE WHEN o.status IN ({_CLAIMABLE}) THEN i.quantity - coalesce(i.claimed, 0) ELSE 0 END"
+
+_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS manifest_item_ai AFTER INSERT ON order_items BEGIN
+        INSERT INTO manifest_changes (event_id, order_id, item_id, remaining)
+        SELECT o.event_id, i.order_id, i.id, {_REMAINING}
+        FROM order_items i JOIN orders o ON o.order_id = i.order_id
+        WHERE i.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS manifest_item_au AFTER UPDATE OF claimed, quantity ON order_items BEGIN
+        INSERT INTO manifest_changes (event_id, order_id, item_id, remaining)
+        SELECT o.event_id, i.order_id, i.id, {_REMAINING}
+        FROM order_items i JOIN orders o ON o.order_id = i.order_id
+        WHERE i.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS manifest_order_au AFTER UPDATE OF status ON orders
+    WHEN old.status IS NOT new.status BEGIN
+        INSERT INTO manifest_changes (event_id, order_id, item_id, remaining)
+        SELECT o.event_id, i.order_id, i.id, {_REMAINING}
+        FROM order_items i JOIN orders o ON o.order_id = i.order_id
+        WHERE o.order_id = new.order_id;
+    END
+    """,
+]
+
+
+def ensure_triggers(connection):
+    for ddl in _DDL:
+        connection.exec_driver_sql(ddl)
+
+
+@event.listens_for(OrderItem.__table__, 'after_create')
+def _create_triggers(target, connection, **kw):
+    # create_all recrea order_items sin triggers. SQLite resuelve manifest_changes al ejecutar
+    # el trigger, así que no importa si esa tabla se crea después.
+    ensure_triggers(connection)
+
+
+def prune(connection, today=None):
+    """Aplica la retención descrita en el docstring del módulo. Devuelve cuántas filas borró."""
+    cutoff = (today or date.today()) - timedelta(days=1)
+    current = select(Event.id).where(Event.iso_date >= cutoff)
+    deleted = connection.execute(
+        delete(ManifestChange).where(ManifestChange.event_id.not_in(current))
+    ).rowcount
+    # Conserva el último seq de cada ítem: changes_since y last_seq no cambian
+    latest = select(func.max(ManifestChange.seq)).group_by(ManifestChange.item_id)
+    deleted += connection.execute(
+        delete(ManifestChange).where(ManifestChange.seq.not_in(latest))
+    ).rowcount
+    return deleted
+
+
+def drop_event(connection, event_id):
+    connection.execute(delete(ManifestChange).where(ManifestChange.event_id == event_id))
+
+
+def last_seq(session, event_id):
+    return session.execute(
+        select(func.max(ManifestChange.seq)).where(ManifestChange.event_id == event_id)
+    ).scalar() or 0
+
+
+def build_manifest(session, event_id):
+    """Manifiesto columnar: una lista de órdenes y los ítems como [item_id, índice_orden, saldo]."""
+    # El seq se lee antes que los datos: un cambio concurrente puede quedar incluido
+    # y además llegar en el siguiente delta, lo que es inocuo (el saldo es absoluto).
+    seq = last_seq(session, event_id)
+    remaining = OrderItem.quantity - func.coalesce(OrderItem.claimed, 0)
+    rows = session.execute(
+        select(OrderItem.order_id, OrderItem.id, remaining)
+        .join(Order, Order.order_id == OrderItem.order_id)
+        .where(Order.event_id == event_id, Order.status.in_(CLAIMABLE_STATUSES), remaining > 0)
+        # Sigue el índice (event_id, created_at, order_id): solo se ordenan los ítems de cada orden
+        .order_by(Order.created_at, Order.order_id, OrderItem.id)
+    ).all()
+
+    orders, items = [], []
+    order_index = {}
+    for order_id, item_id, left in rows:
+        if order_id not in order_index:
+            order_index[order_id] = len(orders)
+            orders.append(order_id)
+        items.append([item_id, order_index[order_id], left])
+
+    return {'event_id': event_id, 'seq': seq, 'orders': orders, 'items': items}
+
+
+def changes_since(session, event_id, since):
+    """Último saldo de cada ítem que cambió después de `since`: [[item_id, order_id, saldo], ...]."""
+    upto = last_seq(session, event_id)
+    if upto <= since:
+        return {'event_id': event_id, 'since': since, 'seq': since, 'changes': []}
+
+    # Las filas salen en orden de seq por el índice (event_id, seq), sin GROUP BY: gana la última de cada ítem
+    rows = session.execute(
+        select(ManifestChange.item_id, ManifestChange.order_id, ManifestChange.remaining)
+        .where(ManifestChange.event_id == event_id, ManifestChange.seq > since, ManifestChange.seq <= upto)
+        .order_by(ManifestChange.seq)
+    )
+    latest = {item_id: (order_id, left) for item_id, order_id, left in rows}
+    return {
+        'event_id': event_id,
+        'since': since,
+        'seq': upto,
+        'changes': [[item_id, order_id, left] for item_id, (order_id, left) in latest.items()],
+    }
+
+
+def compact_response(payload):
+    """JSON compacto, comprimido con gzip si el cliente lo acepta."""
+    body = current_app.json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    if 'gzip' in request.accept_encodings:
+        response = current_app.response_class(gzip.compress(body, compresslevel=6), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return current_app.response_class(body, mimetype='application/json')
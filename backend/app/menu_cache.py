@@ -0,0 +1,234 @@
+"""Snapshot precompilado de la carta pública por evento.
+
+GET /api/catalog/events/<event_id>/menu se consulta masivamente durante un
+evento, así que guardamos por worker el JSON ya serializado (bytes + ETag) y
+solo lo reconstruimos cuando cambia la versión del evento en `menu_versions`.
+
+La versión se incrementa dentro de la misma transacción que escribe un Menu,
+MenuProduct, Product o Category (listener `after_flush`), por lo que todos los
+procesos ven la invalidación al mismo tiempo que los datos nuevos.
+"""
+import hashlib
+import threading
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import Menu, MenuProduct, Product, Category, MenuVersion
+
+
+class MenuSnapshot:
+    __slots__ = ('event_id', 'version', 'body', 'etag')
+
+    def __init__(self, event_id, version, body, etag):
+        self.event_id = event_id
+        self.version = version
+        self.body = body
+        self.etag = etag
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def build_menu_tree(menu):
+    """Arma la estructura categorías -> productos -> variaciones con una sola query."""
+    rows = db.session.execute(
+        select(MenuProduct, Product, Category)
+        .join(Product, MenuProduct.product_id == Product.id)
+        .outerjoin(Category, Product.category_id == Category.id)
+        .where(MenuProduct.menu_id == menu.id, MenuProduct.active == True)
+        .order_by(MenuProduct.category_display_order, MenuProduct.product_display_order, MenuProduct.id)
+    ).all()
+
+    categories_map = {}
+    for mp, prod, cat in rows:
+        if cat is None:
+            # Fallback category
+            cat_id, cat_name, cat_desc = 0, "Otros", ""
+        else:
+            cat_id, cat_name, cat_desc = cat.id, cat.name, cat.description
+
+        if cat_id not in categories_map:
+            categories_map[cat_id] = {
+                'id': cat_id,
+                'name': cat_name,
+                'description': cat_desc,
+                'products': []
+            }
+
+        # Product -> [Variation(Self)], igual que espera el componente DrinkMenu
+        categories_map[cat_id]['products'].append({
+            'id': prod.id,
+            'name': prod.name,
+            'description': prod.description,
+            'image': prod.image_url,
+            'variations': [
+                {
+                    'id': mp.id,
+                    'name': prod.name,
+                    'price': float(mp.price) if mp.price is not None else float(prod.price)
+                }
+            ]
+        })
+
+    return {
+        'id': menu.id,
+        'name': menu.name,
+        'categories': list(categories_map.values())
+    }
+
+
+def current_version(event_id):
+    version = db.session.execute(
+        select(MenuVersion.version).where(MenuVersion.event_id == event_id)
+    ).scalar()
+    return version or 0
+
+
+def get_menu_snapshot(event_id):
+    """Devuelve el snapshot vigente del evento, o None si no tiene carta."""
+    # Leemos la versión antes que los datos: si alguien escribe entremedio,
+    # guardamos datos más nuevos que la versión y solo se reconstruye una vez más.
+    version = current_version(event_id)
+    snapshot = _snapshots.get(event_id)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    menu = Menu.query.filter_by(event_id=event_id).order_by(Menu.id).first()
+    if not menu:
+        return None
+
+    body = current_app.json.dumps(build_menu_tree(menu), separators=(',', ':')).encode('utf-8')
+    etag = f"{event_id}-{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+    snapshot = MenuSnapshot(event_id, version, body, etag)
+    with _lock:
+        _snapshots[event_id] = snapshot
+    return snapshot
+
+
+def clear_snapshots():
+    with _lock:
+        _snapshots.clear()
+        _price_tables.clear()
+
+
+# --- Tabla de precios para el checkout ---
+
+class PriceEntry:
+    __slots__ = ('menu_product_id', 'product_id', 'product_name', 'price')
+
+    def __init__(self, menu_product_id, product_id, product_name, price):
+        self.menu_product_id = menu_product_id
+        self.product_id = product_id
+        self.product_name = product_name
+        self.price = price
+
+
+_price_tables = {}
+
+
+def get_price_table(event_id):
+    """{menu_product_id: PriceEntry} de los productos activos de la carta del evento, o None si no hay carta.
+
+    Comparte la versión del snapshot: se recalcula solo cuando cambia la carta.
+    """
+    version = current_version(event_id)
+    cached = _price_tables.get(event_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    menu_id = db.session.execute(
+        select(Menu.id).where(Menu.event_id == event_id).order_by(Menu.id).limit(1)
+    ).scalar()
+    if menu_id is None:
+        return None
+
+    table = {}
+    for mp_id, product_id, name, mp_price, base_price in db.session.execute(
+        select(MenuProduct.id, Product.id, Product.name, MenuProduct.price, Product.price)
+        .join(Product, MenuProduct.product_id == Product.id)
+        .where(MenuProduct.menu_id == menu_id, MenuProduct.active == True)
+    ):
+        # Mismo criterio que la carta pública: precio de la carta o, si no tiene, el precio base
+        price = mp_price if mp_price is not None else base_price
+        if price is not None:
+            table[mp_id] = PriceEntry(mp_id, product_id, name, price)
+
+    with _lock:
+        _price_tables[event_id] = (version, table)
+    return table
+
+
+# --- Invalidación ---
+
+def event_ids_for(connection, menu_ids=(), product_ids=(), category_ids=()):
+    """Resuelve qué eventos tienen una carta afectada por los ids dados."""
+    event_ids = set()
+    if menu_ids:
+        event_ids.update(connection.execute(
+            select(Menu.event_id).where(Menu.id.in_(menu_ids))
+        ).scalars())
+    if product_ids:
+        event_ids.update(connection.execute(
+            select(Menu.event_id)
+            .join(MenuProduct, MenuProduct.menu_id == Menu.id)
+            .where(MenuProduct.product_id.in_(product_ids))
+        ).scalars())
+    if category_ids:
+        event_ids.update(connection.execute(
+            select(Menu.event_id)
+            .join(MenuProduct, MenuProduct.menu_id == Menu.id)
+            .join(Product, MenuProduct.product_id == Product.id)
+            .where(Product.category_id.in_(category_ids))
+        ).scalars())
+    event_ids.discard(None)
+    return event_ids
+
+
+def bump_versions(connection, event_ids):
+    """Incrementa la versión de cada evento (upsert). Usar dentro de la transacción de escritura."""
+    for event_id in event_ids:
+        stmt = sqlite_insert(MenuVersion.__table__).values(event_id=event_id, version=1)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['event_id'],
+            set_={'version': MenuVersion.__table__.c.version + 1}
+        ))
+
+
+def invalidate_menus(connection, menu_ids):
+    """Para escrituras masivas (UPDATE/INSERT directos) que no pasan por el flush del ORM."""
+    bump_versions(connection, event_ids_for(connection, menu_ids=menu_ids))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_catalog_writes(session, flush_context):
+    menu_event_ids = set()
+    menu_ids, product_ids, category_ids = set(), set(), set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Menu):
+            menu_event_ids.add(obj.event_id)
+            # Si cambió el evento de la carta, el evento anterior también queda obsoleto
+            menu_event_ids.update(inspect(obj).attrs.event_id.history.deleted)
+        elif isinstance(obj, MenuProduct):
+            menu_ids.add(obj.menu_id)
+            menu_ids.update(inspect(obj).attrs.menu_id.history.deleted)
+        elif isinstance(obj, Product):
+            product_ids.add(obj.id)
+        elif isinstance(obj, Category):
+            category_ids.add(obj.id)
+
+    menu_ids.discard(None)
+    product_ids.discard(None)
+    category_ids.discard(None)
+    if not (menu_event_ids or menu_ids or product_ids or category_ids):
+        return
+
+    connection = session.connection()
+    event_ids = event_ids_for(connection, menu_ids, product_ids, category_ids)
+    event_ids.update(e for e in menu_event_ids if e is not None)
+    bump_versions(connection, event_ids)
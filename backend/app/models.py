@@ -36,6 +36,11 @@ class User(db.Model):
     gender = db.Column(db.Enum(Gender), nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # Cubre la rama de usuarios del feed de actividad (ver stats_routes._activity_page)
+        db.Index('ix_users_created_feed', 'created_at', 'id', 'name'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -54,7 +59,7 @@ class Menu(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=True) # Optional link to an event, or required? User said "associated to an event". Let's make it nullable to avoid circular issues during creation if needed, but intended to be populated.
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=True, index=True) # Optional link to an event, or required? User said "associated to an event". Let's make it nullable to avoid circular issues during creation if needed, but intended to be populated.
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -68,7 +73,7 @@ class Menu(db.Model):
             'event_id': self.event_id,
             'event_name': self.event.name if self.event else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'products_count': len(self.menu_products)
+            'products_count': self.products_count
         }
 
 class MenuProduct(db.Model):
@@ -76,12 +81,17 @@ class MenuProduct(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     menu_id = db.Column(db.Integer, db.ForeignKey('menus.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     price = db.Column(db.Numeric(10, 2), nullable=True) # Price specific to this menu
     product_display_order = db.Column(db.Integer, default=0)
     category_display_order = db.Column(db.Integer, default=0)
     active = db.Column(db.Boolean, default=True)
 
+    # Carta de un menú en su orden de despliegue (WHERE menu_id ORDER BY categoría, producto, id) sin ordenar
+    __table_args__ = (
+        db.Index('ix_menu_products_menu_order', 'menu_id', 'category_display_order', 'product_display_order'),
+    )
+
     # Relationship to Product to get name/image
     product = db.relationship('Product')
 
@@ -100,6 +110,25 @@ class MenuProduct(db.Model):
         }
 
 
+# Conteo de productos como subconsulta correlacionada: el listado de cartas no
+# necesita cargar menu_products solo para hacer len().
+Menu.products_count = db.column_property(
+    db.select(func.count(MenuProduct.id))
+    .where(MenuProduct.menu_id == Menu.id)
+    .correlate_except(MenuProduct)
+    .scalar_subquery()
+)
+
+
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_versions'
+
+    # Contador por evento que se incrementa en cada escritura que afecta su carta.
+    # Permite que todos los workers invaliden su snapshot cacheado (ver app/menu_cache.py).
+    event_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+
 class Category(db.Model):
     __tablename__ = 'categories'
 
@@ -130,7 +159,7 @@ class Product(db.Model):
     __tablename__ = 'products'
 
     id = db.Column(db.Integer, primary_key=True)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.Text, nullable=True)
     image_url = db.Column(db.String, nullable=True)
@@ -167,6 +196,11 @@ class Event(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     carousel_order = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+    # Listado público: WHERE is_active [AND is_featured] [AND iso_date ...] ORDER BY is_featured DESC, iso_date
+    __table_args__ = (
+        db.Index('ix_events_public_order', 'is_active', db.text('is_featured DESC'), 'iso_date'),
+    )
     
     # menus relationship defined in Menu
 
@@ -207,6 +241,15 @@ class Order(db.Model):
     # Relationships
     items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan')
 
+    # Historial y listado admin: filtro + orden (created_at, order_id) desc para paginar por keyset
+    __table_args__ = (
+        db.Index('ix_orders_user_created', 'user_id', 'created_at', 'order_id'),
+        db.Index('ix_orders_event_created', 'event_id', 'created_at', 'order_id'),
+        db.Index('ix_orders_status_created', 'status', 'created_at', 'order_id'),
+        # Sin filtro (listado admin, export, feed de actividad): cubre la rama de órdenes del feed
+        db.Index('ix_orders_created_feed', 'created_at', 'order_id', 'user_id'),
+    )
+
     def to_dict(self):
         return {
             'order_id': self.order_id,
@@ -225,7 +268,7 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
 
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.String, db.ForeignKey('orders.order_id'), nullable=False)
+    order_id = db.Column(db.String, db.ForeignKey('orders.order_id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, nullable=False) # Relation to Product ID
     product_name = db.Column(db.String, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
@@ -243,6 +286,100 @@ class OrderItem(db.Model):
             'price_at_purchase': float(self.price_at_purchase) if self.price_at_purchase else 0.0
         }
 
+class ManifestChange(db.Model):
+    __tablename__ = 'manifest_changes'
+
+    # Log de cambios de "saldo por canjear" por ítem, alimentado por triggers de SQLite
+    # (ver app/manifest.py). Los escáneres offline piden los cambios desde su último seq.
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.String, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    remaining = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_manifest_changes_event_seq', 'event_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class RedeemedToken(db.Model):
+    __tablename__ = 'redeemed_tokens'
+
+    # Registro append-only de QRs agotados (orden o ítem sin saldo), escrito en la misma
+    # transacción del canje. Reconstruye el ledger en memoria al iniciar (ver app/redemption_ledger.py).
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_id = db.Column(db.Integer, nullable=False)
+    token_key = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Una fila por clave agotada (se escribe con INSERT OR IGNORE); también sirve para las búsquedas
+        db.UniqueConstraint('event_id', 'token_key', name='uq_redeemed_tokens_event_key'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    # Respuesta guardada por (endpoint, Idempotency-Key) para que los reintentos del cliente
+    # no repitan la escritura ni la llamada a Transbank (ver app/idempotency.py).
+    # status_code NULL = la primera request aún se está procesando.
+    scope = db.Column(db.String, primary_key=True)
+    key = db.Column(db.String, primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    mimetype = db.Column(db.String, nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class LiveMessage(db.Model):
+    __tablename__ = 'live_messages'
+
+    # Mensajes del canal SSE, escritos en la misma transacción que el cambio que anuncian. Cada
+    # worker los lee por seq y los reparte a sus clientes conectados (ver app/live_events.py).
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        {'sqlite_autoincrement': True},
+    )
+
+
+class SalesRollupMixin:
+    # Acumulados de ventas mantenidos por triggers de SQLite en la misma transacción que la
+    # orden, el canje o el cambio de estado de Webpay (ver app/sales_rollups.py).
+    # Las órdenes CANCELLED solo suman en cancelled_count.
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    items_claimed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SalesByDay(SalesRollupMixin, db.Model):
+    __tablename__ = 'sales_rollup_day'
+
+    day = db.Column(db.String(10), primary_key=True)  # 'YYYY-MM-DD' de created_at (UTC)
+
+
+class SalesByHour(SalesRollupMixin, db.Model):
+    __tablename__ = 'sales_rollup_hour'
+
+    hour = db.Column(db.String(13), primary_key=True)  # 'YYYY-MM-DD HH' de created_at (UTC)
+
+
+class SalesByEvent(SalesRollupMixin, db.Model):
+    __tablename__ = 'sales_rollup_event'
+
+    event_id = db.Column(db.Integer, primary_key=True)
+
+
 class Promotion(db.Model):
     __tablename__ = 'promotions'
     id = db.Column(db.Integer, primary_key=True)
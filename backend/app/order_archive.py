@@ -0,0 +1,164 @@
+"""Particionado caliente/frío de órdenes (ORDER_ARCHIVE=1).
+
+Las órdenes de eventos ya terminados se mueven de `orders`/`order_items` del
+archivo principal a un archivo SQLite aparte (`orders_archive.db`), que cada
+conexión adjunta con ATTACH como `cold`. El archivo principal queda solo con
+los eventos vigentes: sus índices son chicos y las lecturas de eventos pasados
+toman el lock del archivo frío, no el del que reciben los checkouts.
+
+Las consultas que cruzan eventos (historial, listado admin, export, dashboard)
+leen las vistas temporales `orders_all` / `order_items_all` (UNION ALL de ambos
+archivos) a través de `sources()`. Las escrituras siguen yendo a las tablas del
+archivo principal: solo se archivan eventos pasados, que ya no reciben compras
+ni canjes.
+
+Un archivo por evento no escala con ATTACH (SQLite admite 10 bases adjuntas por
+conexión), por eso lo frío comparte un archivo, indexado igual que el caliente.
+"""
+import os
+from datetime import date
+
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from .extensions import db, READ_BIND
+from .manifest import drop_event
+from .models import Order, OrderItem
+
+SCHEMA = 'cold'
+
+enabled = False
+_path = None
+_ddl = []
+_orders_all = None
+_items_all = None
+
+
+def _cold_tables():
+    # orders antes que order_items, para que la FK de la copia apunte a cold.orders
+    metadata = MetaData()
+    return [t.to_metadata(metadata, schema=SCHEMA) for t in (Order.__table__, OrderItem.__table__)]
+
+
+def _view_table(table, name):
+    # Tabla "de mentira" (otra MetaData, nunca se crea) con las columnas del modelo sobre la vista
+    return table.to_metadata(MetaData(), name=name)
+
+
+def _columns(table):
+    return ', '.join(c.name for c in table.columns)
+
+
+def init_app(app, path=None):
+    global enabled, _path, _orders_all, _items_all
+    enabled = True
+    _path = path or os.path.join(os.path.dirname(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]),
+                                 'orders_archive.db')
+
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect
+
+        _ddl.clear()
+        for cold in _cold_tables():
+            _ddl.append(str(CreateTable(cold).compile(dialect=dialect)).replace(
+                'CREATE TABLE ', 'CREATE TABLE IF NOT EXISTS ', 1))
+            for index in cold.indexes:
+                _ddl.append(str(CreateIndex(index).compile(dialect=dialect)).replace(
+                    'CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+        for table, view in ((Order.__table__, 'orders_all'), (OrderItem.__table__, 'order_items_all')):
+            columns = _columns(table)
+            _ddl.append(
+                f"CREATE TEMP VIEW IF NOT EXISTS {view} AS "
+                f"SELECT {columns} FROM main.{table.name} UNION ALL SELECT {columns} FROM {SCHEMA}.{table.name}"
+            )
+
+        _orders_all = aliased(Order, _view_table(Order.__table__, 'orders_all'), adapt_on_names=True)
+        _items_all = aliased(OrderItem, _view_table(OrderItem.__table__, 'order_items_all'), adapt_on_names=True)
+
+        event.listen(engine, 'connect', _attach)
+        event.listen(Order.__table__, 'after_drop', _clear_cold)
+        engine.dispose()
+
+        read_engine = db.engines.get(READ_BIND)
+        if read_engine is not None and read_engine.dialect.name == 'sqlite':
+            # El engine principal crea las tablas frías; el de solo lectura solo adjunta el archivo
+            with engine.connect():
+                pass
+            event.listen(read_engine, 'connect', _attach_read)
+            read_engine.dispose()
+
+
+def _attach(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (_path,))
+    for ddl in _ddl:
+        cursor.execute(ddl)
+    cursor.close()
+
+
+def _attach_read(dbapi_connection, connection_record):
+    # Corre después de los PRAGMA del perfil (temp_store borra las vistas TEMP si va después);
+    # query_only también bloquea las vistas TEMP, así que se suspende solo para crearlas
+    dbapi_connection.execute("PRAGMA query_only = OFF")
+    _attach(dbapi_connection, connection_record)
+    dbapi_connection.execute("PRAGMA query_only = ON")
+
+
+def _clear_cold(target, connection, **kw):
+    # reset-db borra las tablas calientes: lo archivado tampoco debe seguir apareciendo
+    connection.exec_driver_sql(f"DELETE FROM {SCHEMA}.order_items")
+    connection.exec_driver_sql(f"DELETE FROM {SCHEMA}.orders")
+
+
+def sources():
+    """Entidades (orders, items) para lecturas que cruzan eventos: las vistas UNION si hay archivo frío."""
+    if enabled:
+        return _orders_all, _items_all
+    return Order, OrderItem
+
+
+def archive_event(event_id, today=None):
+    """Mueve las órdenes de un evento pasado al archivo frío. Devuelve cuántas órdenes movió."""
+    if not enabled:
+        raise RuntimeError('ORDER_ARCHIVE is not enabled')
+
+    orders_cols = _columns(Order.__table__)
+    items_cols = _columns(OrderItem.__table__)
+    params = {'event_id': event_id, 'today': (today or date.today()).isoformat()}
+    # Dos transacciones: SQLite no confirma atómicamente entre archivos (el principal está en WAL y
+    # se confirma primero; `cold` usa rollback journal). Primero se confirma la copia en el frío y
+    # después se borra del principal solo lo que ya está en el frío. Si el proceso muere entre ambas,
+    # las órdenes quedan duplicadas (no perdidas) y reejecutar el archivado lo completa.
+    with db.engine.begin() as connection:
+        event_date = connection.execute(text(
+            "SELECT iso_date FROM main.events WHERE id = :event_id"
+        ), params).scalar()
+        if event_date is None:
+            raise LookupError('Event not found')
+        if event_date >= params['today']:
+            raise ValueError('Only past events can be archived')
+
+        connection.execute(text(
+            f"INSERT OR REPLACE INTO {SCHEMA}.order_items ({items_cols}) "
+            f"SELECT {items_cols} FROM main.order_items WHERE order_id IN "
+            f"(SELECT order_id FROM main.orders WHERE event_id = :event_id)"
+        ), params)
+        moved = connection.execute(text(
+            f"INSERT OR REPLACE INTO {SCHEMA}.orders ({orders_cols}) "
+            f"SELECT {orders_cols} FROM main.orders WHERE event_id = :event_id"
+        ), params).rowcount
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            f"DELETE FROM main.order_items WHERE id IN (SELECT id FROM {SCHEMA}.order_items) "
+            f"AND order_id IN (SELECT order_id FROM main.orders WHERE event_id = :event_id)"
+        ), params)
+        connection.execute(text(
+            f"DELETE FROM main.orders WHERE event_id = :event_id "
+            f"AND order_id IN (SELECT order_id FROM {SCHEMA}.orders WHERE event_id = :event_id)"
+        ), params)
+        # Evento pasado: los escáneres ya no piden su manifiesto (ver app/manifest.py)
+        drop_event(connection, event_id)
+    return moved
@@ -0,0 +1,133 @@
+"""Tokens QR firmados con HMAC, verificables sin consultar la base de datos.
+
+Formato (versión 1):
+
+    SK1.<payload base64url>.<firma base64url>
+
+El payload es binario: tipo (orden / ítem), event_id, expiración (epoch),
+item_id (0 para "QR Global") y order_id. La firma es HMAC-SHA256 truncada a
+16 bytes sobre "SK1." + payload. El escáner puede rechazar un QR falsificado,
+vencido o de otro evento antes de tocar SQLite.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+
+PREFIX = 'SK1'
+KIND_ORDER = 0
+KIND_ITEM = 1
+
+_HEADER = struct.Struct('>BIII')  # kind, event_id, expires_at, item_id
+_SIGNATURE_BYTES = 16
+
+# Margen tras el término del evento para canjear lo pendiente en barra
+EXPIRY_GRACE = timedelta(hours=6)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class QrClaims:
+    __slots__ = ('kind', 'event_id', 'expires_at', 'item_id', 'order_id')
+
+    def __init__(self, kind, event_id, expires_at, item_id, order_id):
+        self.kind = kind
+        self.event_id = event_id
+        self.expires_at = expires_at
+        self.item_id = item_id
+        self.order_id = order_id
+
+    @property
+    def is_item(self):
+        return self.kind == KIND_ITEM
+
+    def to_dict(self):
+        return {
+            'mode': 'item' if self.is_item else 'order',
+            'event_id': self.event_id,
+            'expires_at': self.expires_at,
+            'item_id': self.item_id if self.is_item else None,
+            'order_id': self.order_id,
+        }
+
+
+def _secret():
+    # Clave propia para QRs si existe; si no, la misma SECRET_KEY del resto del backend
+    key = os.getenv('QR_SECRET_KEY') or os.getenv('SECRET_KEY', 'super_secret_key')
+    return key.encode('utf-8')
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload, secret):
+    return hmac.new(secret, PREFIX.encode('ascii') + b'.' + payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def default_expiry(event):
+    """Vence EXPIRY_GRACE después del término del evento (los que cruzan la medianoche terminan al día siguiente)."""
+    if event is None:
+        return int(time.time()) + 7 * 24 * 3600
+    end = datetime.combine(event.iso_date, event.end_time)
+    if event.end_time <= event.start_time:
+        end += timedelta(days=1)
+    return int((end + EXPIRY_GRACE).timestamp())
+
+
+def issue(order_id, event_id, expires_at, item_id=None, secret=None):
+    kind = KIND_ITEM if item_id is not None else KIND_ORDER
+    payload = _HEADER.pack(kind, event_id, expires_at, item_id or 0) + order_id.encode('utf-8')
+    signature = _sign(payload, secret or _secret())
+    return f"{PREFIX}.{_b64encode(payload)}.{_b64encode(signature)}"
+
+
+def verify(token, event_id=None, now=None, secret=None):
+    """Devuelve QrClaims o lanza InvalidToken. No consulta la base de datos."""
+    try:
+        prefix, payload_b64, signature_b64 = token.split('.')
+    except (AttributeError, ValueError):
+        raise InvalidToken('Malformed token')
+    if prefix != PREFIX:
+        raise InvalidToken('Unsupported token version')
+
+    try:
+        payload = _b64decode(payload_b64)
+        signature = _b64decode(signature_b64)
+    except (ValueError, TypeError):
+        raise InvalidToken('Malformed token')
+
+    if not hmac.compare_digest(signature, _sign(payload, secret or _secret())):
+        raise InvalidToken('Invalid signature')
+    if len(payload) <= _HEADER.size:
+        raise InvalidToken('Malformed token')
+
+    kind, token_event_id, expires_at, item_id = _HEADER.unpack_from(payload)
+    if expires_at < (now if now is not None else time.time()):
+        raise InvalidToken('Token expired')
+    if event_id is not None and token_event_id != event_id:
+        raise InvalidToken('Token belongs to another event')
+
+    return QrClaims(kind, token_event_id, expires_at, item_id, payload[_HEADER.size:].decode('utf-8'))
+
+
+def order_token(order, event):
+    """Token "QR Global": permite canjear todo lo pendiente de la orden.
+
+    `event` es el Event de order.event_id: Order.iso_date es la fecha de compra, no la del evento.
+    """
+    return issue(order.order_id, order.event_id, default_expiry(event))
+
+
+def item_token(order, event, item_id):
+    """Token "QR Individual": permite canjear unidades de un solo ítem de la orden."""
+    return issue(order.order_id, order.event_id, default_expiry(event), item_id=item_id)
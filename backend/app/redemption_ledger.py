@@ -0,0 +1,199 @@
+"""Ledger en memoria de QRs ya agotados, para rechazar reescaneos sin transacción.
+
+Un QR está agotado cuando su orden (QR Global) o su ítem (QR Individual) ya no
+tiene saldo por canjear. app/claims.py registra esas claves en la tabla
+append-only `redeemed_tokens` (una fila por clave) dentro de la misma
+transacción del canje, y al confirmar se agregan al ledger de este worker. /api/claims/scan consulta el
+ledger antes de abrir la transacción, así un reescaneo no compite por el lock
+de escritura de SQLite.
+
+Por evento se guarda un LRU acotado de claves. Opcionalmente
+(REDEMPTION_LEDGER_BLOOM=1) también un filtro de Bloom con todo lo agotado del
+evento: si la clave salió del LRU pero el Bloom la reconoce, se confirma con un
+SELECT sobre `redeemed_tokens` (una lectura, no toma el lock de escritura).
+
+Lo que agota otro worker se aprende cuando su canje es rechazado aquí. Al
+iniciar, el worker carga solo las claves de los eventos vigentes (desde ayer,
+por los que terminan de madrugada): el costo no crece con el historial.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.orm import Session
+
+from .models import Event, Order, RedeemedToken
+
+MAX_EVENTS = 16
+_PENDING = 'redemption_ledger_pending'
+
+
+def order_key(order_id):
+    return f'o:{order_id}'
+
+
+def item_key(item_id):
+    return f'i:{item_id}'
+
+
+class BloomFilter:
+    def __init__(self, capacity, hashes=7):
+        # ~10 bits por elemento con 7 hashes: ~1% de falsos positivos a plena capacidad
+        self.size = max(capacity * 10, 1024)
+        self.hashes = hashes
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RedemptionLedger:
+    def __init__(self, max_per_event=100_000, bloom=False):
+        self.max_per_event = max_per_event
+        self.bloom = bloom
+        self.hits = 0
+        self.bloom_hits = 0
+        self.misses = 0
+        self._events = OrderedDict()  # event_id -> (OrderedDict de claves, BloomFilter | None)
+        self._lock = threading.Lock()
+
+    def _event(self, event_id, create=False):
+        entry = self._events.get(event_id)
+        if entry is None and create:
+            entry = (OrderedDict(), BloomFilter(self.max_per_event) if self.bloom else None)
+            self._events[event_id] = entry
+            while len(self._events) > MAX_EVENTS:
+                self._events.popitem(last=False)
+        if entry is not None:
+            self._events.move_to_end(event_id)
+        return entry
+
+    def add(self, event_id, keys):
+        with self._lock:
+            seen, bloom = self._event(event_id, create=True)
+            for key in keys:
+                seen[key] = None
+                seen.move_to_end(key)
+                if bloom is not None:
+                    bloom.add(key)
+            while len(seen) > self.max_per_event:
+                seen.popitem(last=False)
+
+    def contains(self, session, event_id, key):
+        """True si la clave está agotada. Solo consulta la base si el Bloom la reconoce."""
+        with self._lock:
+            entry = self._event(event_id)
+            if entry is not None:
+                seen, bloom = entry
+                if key in seen:
+                    seen.move_to_end(key)
+                    self.hits += 1
+                    return True
+                maybe = bloom is not None and key in bloom
+            else:
+                maybe = False
+            if not maybe:
+                self.misses += 1
+                return False
+
+        found = session.execute(
+            select(RedeemedToken.id)
+            .where(RedeemedToken.event_id == event_id, RedeemedToken.token_key == key)
+            .limit(1)
+        ).first() is not None
+        with self._lock:
+            if found:
+                self.bloom_hits += 1
+            else:
+                self.misses += 1
+        if found:
+            self.add(event_id, [key])
+        return found
+
+    def record(self, session, order_id, event_id, keys):
+        """Persiste las claves agotadas en la transacción actual; pasan a memoria al hacer commit."""
+        if not keys:
+            return
+        if event_id is None:
+            event_id = session.execute(select(Order.event_id).where(Order.order_id == order_id)).scalar()
+        # Una clave puede agotarse de nuevo (p. ej. otro worker ya la registró): no se duplica
+        session.execute(insert(RedeemedToken).prefix_with('OR IGNORE'),
+                        [{'event_id': event_id, 'token_key': k} for k in keys])
+        session.info.setdefault(_PENDING, []).append((event_id, keys))
+
+    def load(self, connection, today=None):
+        """Reconstruye el ledger desde `redeemed_tokens` con los eventos vigentes (al iniciar el worker)."""
+        self.clear()
+        cutoff = (today or date.today()) - timedelta(days=1)
+        rows = connection.execute(
+            select(RedeemedToken.event_id, RedeemedToken.token_key)
+            .where(RedeemedToken.event_id.in_(select(Event.id).where(Event.iso_date >= cutoff)))
+            .order_by(RedeemedToken.id)
+        )
+        for event_id, key in rows:
+            self.add(event_id, [key])
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'events': len(self._events),
+                'keys': sum(len(seen) for seen, _ in self._events.values()),
+                'max_per_event': self.max_per_event,
+                'bloom': self.bloom,
+                'hits': self.hits,
+                'bloom_hits': self.bloom_hits,
+                'misses': self.misses,
+            }
+
+
+def ensure_unique(connection):
+    """Bases creadas antes de uq_redeemed_tokens_event_key: quita duplicados y crea el índice único."""
+    indexes = connection.exec_driver_sql("PRAGMA index_list(redeemed_tokens)").all()
+    if any(row[2] for row in indexes):  # (seq, name, unique, origin, partial)
+        return
+    keep = select(func.min(RedeemedToken.id)).group_by(RedeemedToken.event_id, RedeemedToken.token_key)
+    connection.execute(RedeemedToken.__table__.delete().where(RedeemedToken.id.not_in(keep)))
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_redeemed_tokens_event_key ON redeemed_tokens (event_id, token_key)"
+    )
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_redeemed_tokens_event_key")
+
+
+ledger = RedemptionLedger(
+    max_per_event=int(os.getenv('REDEMPTION_LEDGER_SIZE', 100_000)),
+    bloom=os.getenv('REDEMPTION_LEDGER_BLOOM', '0') == '1',
+)
+
+
+@event.listens_for(RedeemedToken.__table__, 'after_drop')
+def _reset(target, connection, **kw):
+    # reset-db borra la tabla: lo que había en memoria ya no vale
+    ledger.clear()
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish(session):
+    for event_id, keys in session.info.pop(_PENDING, ()):
+        ledger.add(event_id, keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop(_PENDING, None)
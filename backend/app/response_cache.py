@@ -0,0 +1,108 @@
+"""Cache en memoria de respuestas JSON ya serializadas.
+
+Cada worker mantiene su propia copia. Las entradas se invalidan al hacer commit
+de escrituras sobre los modelos observados (en el propio worker), expiran tras
+`ttl` segundos (acota lo desfasado que puede quedar otro worker) y se vacían al
+cambiar el día local, porque filtros como day/week/year dependen de date.today().
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class ResponseCache:
+    def __init__(self, name, max_entries=256, ttl=30):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._day = date.today()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._roll_day()
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._roll_day()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else None,
+                'invalidations': self.invalidations,
+                'ttl_seconds': self.ttl,
+            }
+
+    def _roll_day(self):
+        today = date.today()
+        if today != self._day:
+            self._entries.clear()
+            self._day = today
+
+    def invalidate_on_commit(self, *models):
+        """Vacía el cache cuando se confirma una transacción que escribió alguno de `models`."""
+        @event.listens_for(Session, 'after_flush')
+        def _mark(session, flush_context):
+            for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+                if isinstance(obj, models):
+                    session.info[self._flag] = True
+                    return
+
+        @event.listens_for(Session, 'after_commit')
+        def _clear(session):
+            if session.info.pop(self._flag, False):
+                self.invalidate()
+
+        @event.listens_for(Session, 'after_rollback')
+        def _discard(session):
+            session.info.pop(self._flag, None)
+
+        return self
+
+    @property
+    def _flag(self):
+        return f'response_cache_dirty:{self.name}'
+
+
+def etag_response(body, etag):
+    """Respuesta con JSON ya serializado y ETag; 304 sin cuerpo si el cliente ya tiene esa versión."""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
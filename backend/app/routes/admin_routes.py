@@ -51,6 +51,20 @@ def reset_db():
         print(f"Error resetting DB: {e}")
         return jsonify({'message': str(e)}), 500
 
+@admin_bp.route('/events/<int:event_id>/archive', methods=['POST'])
+def archive_event_orders(event_id):
+    """Mueve las órdenes de un evento pasado al archivo frío (requiere ORDER_ARCHIVE=1)."""
+    from app import order_archive
+    if not order_archive.enabled:
+        return jsonify({'message': 'Order archive is not enabled (ORDER_ARCHIVE=1)'}), 409
+    try:
+        moved = order_archive.archive_event(event_id)
+    except LookupError as e:
+        return jsonify({'message': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 409
+    return jsonify({'message': 'Event orders archived', 'event_id': event_id, 'orders': moved}), 200
+
 # --- Rutas de Gestión de Imágenes ---
 
 @admin_bp.route('/images', methods=['GET'])
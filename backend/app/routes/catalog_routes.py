@@ -1,13 +1,19 @@
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models import Menu, Category, Product, MenuProduct
+from sqlalchemy import case, func, insert, literal, select, update
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Event, Menu, Category, Product, MenuProduct
+from app.menu_cache import get_menu_snapshot, invalidate_menus
+from app.search import search_products
+from app.response_cache import etag_response
 
 catalog_bp = Blueprint('catalog', __name__)
 
 # --- Menus ---
 @catalog_bp.route('/menus', methods=['GET'])
 def get_menus():
-    menus = Menu.query.all()
+    # Menu.to_dict lee event.name; products_count ya viene como subconsulta
+    menus = Menu.query.options(joinedload(Menu.event)).all()
     return jsonify([m.to_dict() for m in menus])
 
 @catalog_bp.route('/menus', methods=['POST'])
@@ -21,93 +27,72 @@ def create_menu():
         event_id=data.get('event_id')
     )
     db.session.add(new_menu)
+
+    # Opcional: poblar la carta en la misma request con [{ product_id, price? }, ...]
+    if data.get('products'):
+        db.session.flush()
+        error = _bulk_add_products(new_menu, data['products'])
+        if error:
+            db.session.rollback()
+            return error
+
     db.session.commit()
+    return jsonify(new_menu.to_dict()), 201
+
+@catalog_bp.route('/menus/<int:id>/clone', methods=['POST'])
+def clone_menu(id):
+    # Copia una carta (productos, precios, orden y estado) a otro evento con un solo INSERT ... SELECT
+    source = Menu.query.get_or_404(id)
+    data = request.get_json() or {}
+
+    if 'event_id' not in data:
+        return jsonify({'error': 'event_id is required'}), 400
+    try:
+        event_id = int(data['event_id'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'event_id must be an integer'}), 400
+    if db.session.get(Event, event_id) is None:
+        return jsonify({'error': 'Event not found'}), 404
+
+    new_menu = Menu(
+        name=data.get('name', source.name),
+        event_id=event_id
+    )
     db.session.add(new_menu)
+    db.session.flush()
+
+    columns = ['menu_id', 'product_id', 'price', 'product_display_order', 'category_display_order', 'active']
+    db.session.execute(
+        insert(MenuProduct).from_select(
+            columns,
+            select(
+                literal(new_menu.id), MenuProduct.product_id, MenuProduct.price,
+                MenuProduct.product_display_order, MenuProduct.category_display_order, MenuProduct.active
+            ).where(MenuProduct.menu_id == source.id).order_by(MenuProduct.id)
+        )
+    )
+    invalidate_menus(db.session.connection(), [new_menu.id])
     db.session.commit()
     return jsonify(new_menu.to_dict()), 201
 
 @catalog_bp.route('/events/<int:event_id>/menu', methods=['GET'])
 def get_menu_by_event(event_id):
-    # Find the menu associated with this event
-    # Assuming one menu per event for now, or taking the latest/first
-    menu = Menu.query.filter_by(event_id=event_id).first()
-    
-    if not menu:
+    # Estructura para DrinkMenu: { id, name, categories: [ { id, name, products: [ { ..., variations: [] } ] } ] }
+    # El árbol se arma una vez por versión de la carta y se sirve ya serializado (ver app/menu_cache.py).
+    snapshot = get_menu_snapshot(event_id)
+
+    if not snapshot:
         return jsonify({'error': 'Menu not found for this event'}), 404
-        
-    menu_dict = menu.to_dict()
-    
-    # Process products into hierarchal structure for DrinkMenu component
-    # Structure needed: { id, name, categories: [ { id, name, products: [ { ..., variations: [] } ] } ] }
-    # Since we removed variations, each MenuProduct acts as a product variant in the UI or we group them?
-    # The Generic Front End 'DrinkMenu' expects categories -> products -> variations.
-    # We need to map our flat MenuProducts list to this structure.
-    
-    # 1. Fetch MenuProducts sorted by category order then product order
-    menu_products = sorted(menu.menu_products, key=lambda x: (x.category_display_order, x.product_display_order))
-    
-    # 2. Group by Category
-    categories_map = {}
-    
-    for mp in menu_products:
-        if not mp.active: continue
-        
-        prod = mp.product
-        if not prod: continue
-        
-        cat = prod.category
-        if not cat: 
-             # Fallback category
-             cat_id = 0
-             cat_name = "Otros"
-             cat_desc = ""
-        else:
-             cat_id = cat.id
-             cat_name = cat.name
-             cat_desc = cat.description
-             
-        if cat_id not in categories_map:
-            categories_map[cat_id] = {
-                'id': cat_id,
-                'name': cat_name,
-                'description': cat_desc,
-                'products': []
-            }
-            
-        # 3. Add Product to Category. 
-        # Since we removed 'variations' table, and now Product names include variants (e.g. "Cerveza 330ml"),
-        # We can simulate the structure: Product -> [Variation(Self)]
-        
-        product_entry = {
-            'id': prod.id,
-            'name': prod.name,
-            'description': prod.description,
-            'image': prod.image_url, 
-            'variations': [
-                {
-                    'id': mp.id, 
-                    'name': prod.name, 
-                    'price': float(mp.price) if mp.price is not None else float(prod.price)
-                }
-            ]
-        }
-        
-        categories_map[cat_id]['products'].append(product_entry)
 
-    # Convert map to list - Sorting of categories logic is implicit by the order of insertion if we iterate sorted products
-    # But dictionary iteration order is insertion order in py3.7+. Since we sorted menu_products by category_display_order first,
-    # the keys in categories_map should be added in that order effectively.
-    categories_list = list(categories_map.values())
-    
-    return jsonify({
-        'id': menu.id,
-        'name': menu.name,
-        'categories': categories_list
-    })
+    return etag_response(snapshot.body, snapshot.etag)
 
 @catalog_bp.route('/menus/<int:id>', methods=['GET'])
 def get_menu(id):
-    menu = Menu.query.get_or_404(id)
+    # MenuProduct.to_dict lee product y product.category
+    menu = Menu.query.options(
+        joinedload(Menu.event),
+        selectinload(Menu.menu_products).joinedload(MenuProduct.product).joinedload(Product.category)
+    ).filter_by(id=id).first_or_404()
     menu_dict = menu.to_dict()
     # Add products explicitly sorted
     products = sorted(menu.menu_products, key=lambda x: (x.category_display_order, x.product_display_order))
@@ -138,52 +123,97 @@ def delete_menu(id):
 def add_product_to_menu(id):
     menu = Menu.query.get_or_404(id)
     data = request.get_json()
-    
+
+    # Modo masivo: { products: [ { product_id, price? }, ... ] } o directamente la lista
+    if isinstance(data, list) or (isinstance(data, dict) and 'products' in data):
+        entries = data if isinstance(data, list) else data['products']
+        error = _bulk_add_products(menu, entries)
+        if error:
+            db.session.rollback()
+            return error
+        db.session.commit()
+        menu_products = MenuProduct.query.options(
+            joinedload(MenuProduct.product).joinedload(Product.category)
+        ).filter(
+            MenuProduct.menu_id == menu.id,
+            MenuProduct.product_id.in_([int(e['product_id']) for e in entries])
+        ).order_by(MenuProduct.category_display_order, MenuProduct.product_display_order).all()
+        return jsonify([mp.to_dict() for mp in menu_products]), 201
+
     if 'product_id' not in data:
         return jsonify({'error': 'product_id is required'}), 400
         
-    product = Product.query.get_or_404(data['product_id'])
-    
-    # Check if already exists
-    exists = MenuProduct.query.filter_by(menu_id=menu.id, product_id=product.id).first()
-    if exists:
-        return jsonify({'error': 'Product already in menu'}), 400
-
-    # Determine sorting
-    # We need to find the category order logic. If new products are added, they likely go to the end of their category, 
-    # or the category goes to the end if new.
-    
-    # Determine Category Display Order
-    # Find existing products with same category in this menu
-    cat_id = product.category_id
-    
-    existing_in_cat = [mp for mp in menu.menu_products if mp.product and mp.product.category_id == cat_id]
-    
-    if existing_in_cat:
-        # Category already exists in menu, use its order
-        cat_order = existing_in_cat[0].category_display_order
-        # Find max product order in this category
-        max_prod_order = max([mp.product_display_order for mp in existing_in_cat]) if existing_in_cat else 0
-        prod_order = max_prod_order + 1
-    else:
-        # New category for this menu, put at end
-        max_cat_order = db.session.query(db.func.max(MenuProduct.category_display_order)).filter_by(menu_id=menu.id).scalar() or 0
-        cat_order = max_cat_order + 1
-        prod_order = 1
-    
-    menu_prod = MenuProduct(
-        menu_id=menu.id,
-        product_id=product.id,
-        price=data.get('price', product.price), # Default to base price
-        category_display_order=cat_order,
-        product_display_order=prod_order,
-        active=True
-    )
-    
-    db.session.add(menu_prod)
+    # El alta individual usa el mismo camino que el masivo (orden calculado con una query agregada)
+    error = _bulk_add_products(menu, [data])
+    if error:
+        db.session.rollback()
+        return error
     db.session.commit()
+
+    menu_prod = MenuProduct.query.filter_by(menu_id=menu.id, product_id=int(data['product_id'])).first()
     return jsonify(menu_prod.to_dict()), 201
 
+def _bulk_add_products(menu, entries):
+    """Inserta muchos productos en la carta con un solo INSERT. Devuelve una respuesta de error o None."""
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'products must be a non-empty list'}), 400
+    try:
+        product_ids = [int(e['product_id']) for e in entries]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'product_id is required for every product'}), 400
+    if len(set(product_ids)) != len(product_ids):
+        return jsonify({'error': 'Duplicated product_id in request'}), 400
+
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+    missing = [pid for pid in product_ids if pid not in products]
+    if missing:
+        return jsonify({'error': 'Products not found', 'ids': missing}), 404
+
+    existing = db.session.execute(
+        select(MenuProduct.product_id).where(MenuProduct.menu_id == menu.id, MenuProduct.product_id.in_(product_ids))
+    ).scalars().all()
+    if existing:
+        return jsonify({'error': 'Product already in menu', 'ids': sorted(existing)}), 400
+
+    # Mismo criterio que el alta individual (al final de su categoría, o categoría nueva al final),
+    # pero calculado una sola vez con una query agregada en vez de recorrer menu.menu_products.
+    category_orders = {}
+    max_cat_order = 0
+    for category_id, cat_order, max_cat_in_group, max_prod_order in db.session.execute(
+        select(
+            Product.category_id,
+            func.min(MenuProduct.category_display_order),
+            func.max(MenuProduct.category_display_order),
+            func.max(MenuProduct.product_display_order)
+        )
+        .join(Product, MenuProduct.product_id == Product.id)
+        .where(MenuProduct.menu_id == menu.id)
+        .group_by(Product.category_id)
+    ):
+        category_orders[category_id] = [cat_order, max_prod_order or 0]
+        max_cat_order = max(max_cat_order, max_cat_in_group or 0)
+
+    rows = []
+    for entry in entries:
+        product = products[int(entry['product_id'])]
+        if product.category_id not in category_orders:
+            max_cat_order += 1
+            category_orders[product.category_id] = [max_cat_order, 0]
+        orders = category_orders[product.category_id]
+        orders[1] += 1
+        rows.append({
+            'menu_id': menu.id,
+            'product_id': product.id,
+            'price': entry.get('price', product.price),  # Default to base price
+            'category_display_order': orders[0],
+            'product_display_order': orders[1],
+            'active': True
+        })
+
+    db.session.execute(insert(MenuProduct), rows)
+    invalidate_menus(db.session.connection(), [menu.id])
+    return None
+
 @catalog_bp.route('/menu-products/<int:id>', methods=['PUT'])
 def update_menu_product(id):
     mp = MenuProduct.query.get_or_404(id)
@@ -207,37 +237,122 @@ def remove_product_from_menu(id):
 def reorder_menu_products(id):
     menu = Menu.query.get_or_404(id)
     data = request.get_json()
-    # Expects list of { id: menu_product_id, product_display_order: int, category_display_order: int }
-    # Or simplified logic.
-    
-    if not isinstance(data, list):
+    # Acepta:
+    #   - lista de { id: menu_product_id, product_display_order?: int, category_display_order?: int }
+    #   - { items: [...igual que arriba...], categories: [ { category_id: int, category_display_order: int } ] }
+    # "categories" mueve el bloque completo de una categoría dentro de la carta.
+    # Todo se aplica con UPDATEs set-based en una sola transacción.
+
+    if isinstance(data, list):
+        items, category_moves = data, []
+    elif isinstance(data, dict):
+        items, category_moves = data.get('items', []), data.get('categories', [])
+    else:
         return jsonify({'error': 'List expected'}), 400
-        
-    for item in data:
-        mp = MenuProduct.query.get(item['id'])
-        if mp and mp.menu_id == menu.id:
-            if 'product_display_order' in item:
-                mp.product_display_order = item['product_display_order']
-            if 'category_display_order' in item:
-                # Update this product's category order. 
-                # CRITICAL: We must update ALL products in this category for this menu to keep them together.
-                # However, the frontend might send ALL items updated.
-                # Or we logic it here.
-                # If the user says "Change Category Order", they imply moving the whole block.
-                # If we receive explicit category_display_order for one item, we should probably update peers.
-                # BUT, if the frontend sends the whole list with updated values, we just save them.
-                # Let's assume frontend sends updates for relevant items.
-                mp.category_display_order = item['category_display_order']
-            
+
+    if not isinstance(items, list) or not isinstance(category_moves, list):
+        return jsonify({'error': 'items and categories must be lists'}), 400
+
+    try:
+        product_orders = {int(i['id']): int(i['product_display_order']) for i in items if 'product_display_order' in i}
+        category_orders = {int(i['id']): int(i['category_display_order']) for i in items if 'category_display_order' in i}
+        item_ids = {int(i['id']) for i in items}
+        block_orders = {int(c['category_id']): int(c['category_display_order']) for c in category_moves}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid reorder payload'}), 400
+
+    # Validación de todos los ids contra la carta en una sola query
+    if item_ids:
+        found = set(db.session.execute(
+            select(MenuProduct.id).where(MenuProduct.menu_id == menu.id, MenuProduct.id.in_(item_ids))
+        ).scalars())
+        missing = sorted(item_ids - found)
+        if missing:
+            return jsonify({'error': 'Menu products not found in this menu', 'ids': missing}), 400
+
+    if block_orders:
+        product_category = select(Product.category_id).where(Product.id == MenuProduct.product_id).scalar_subquery()
+        db.session.execute(
+            update(MenuProduct)
+            .where(MenuProduct.menu_id == menu.id, product_category.in_(block_orders))
+            .values(category_display_order=case(block_orders, value=product_category,
+                                                 else_=MenuProduct.category_display_order))
+            .execution_options(synchronize_session=False)
+        )
+
+    if product_orders or category_orders:
+        values = {}
+        if product_orders:
+            values['product_display_order'] = case(product_orders, value=MenuProduct.id,
+                                                   else_=MenuProduct.product_display_order)
+        if category_orders:
+            values['category_display_order'] = case(category_orders, value=MenuProduct.id,
+                                                    else_=MenuProduct.category_display_order)
+        db.session.execute(
+            update(MenuProduct)
+            .where(MenuProduct.menu_id == menu.id, MenuProduct.id.in_(item_ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    # Los UPDATE directos no pasan por el flush del ORM: invalidamos el snapshot a mano
+    invalidate_menus(db.session.connection(), [menu.id])
     db.session.commit()
-    return jsonify({'message': 'Order updated'})
+
+    ordering = db.session.execute(
+        select(MenuProduct.id, MenuProduct.product_id, MenuProduct.category_display_order, MenuProduct.product_display_order)
+        .where(MenuProduct.menu_id == menu.id)
+        .order_by(MenuProduct.category_display_order, MenuProduct.product_display_order, MenuProduct.id)
+    ).all()
+    return jsonify({
+        'message': 'Order updated',
+        'products': [
+            {
+                'id': row.id,
+                'product_id': row.product_id,
+                'category_display_order': row.category_display_order,
+                'product_display_order': row.product_display_order
+            }
+            for row in ordering
+        ]
+    })
 
 
 # --- Categories ---
 @catalog_bp.route('/categories', methods=['GET'])
 def get_categories():
-    categories = Category.query.all()
-    return jsonify([c.to_dict() for c in categories])
+    # Sin parámetros se mantiene el listado completo (lo usa el admin).
+    # ?after=<id>&limit=N pagina por id, ?fields=id,name limita columnas y
+    # ?include_products=false (o fields sin "products") omite los productos anidados.
+    if not any(k in request.args for k in ('after', 'limit', 'fields', 'include_products')):
+        # Product.category se resuelve desde el identity map, sin queries extra
+        categories = Category.query.options(selectinload(Category.products)).all()
+        return jsonify([c.to_dict() for c in categories])
+
+    fields, error = _parse_fields(CATEGORY_FIELDS, extra=('products',))
+    if error:
+        return error
+    if request.args.get('include_products', '').lower() == 'false':
+        fields.discard('products')
+
+    page, error = _parse_page()
+    if error:
+        return error
+
+    columns = [Category.id] + [CATEGORY_FIELDS[f] for f in fields if f in CATEGORY_FIELDS and f != 'id']
+    rows = _page_rows(select(*columns), Category.id, page)
+    items = [_project(row, fields, CATEGORY_FIELDS) for row in rows]
+
+    if 'products' in fields and items:
+        products_by_category = {item['id']: [] for item in items}
+        for product in Product.query.options(joinedload(Product.category)).filter(
+            Product.category_id.in_(products_by_category)
+        ).order_by(Product.id):
+            products_by_category[product.category_id].append(product.to_dict())
+        for item in items:
+            item['products'] = products_by_category[item['id']]
+
+    return _page_response(items, page)
 
 @catalog_bp.route('/categories', methods=['POST'])
 def create_category():
@@ -278,8 +393,24 @@ def delete_category(id):
 # --- Products ---
 @catalog_bp.route('/products', methods=['GET'])
 def get_products():
-    products = Product.query.all()
-    return jsonify([p.to_dict() for p in products])
+    # Mismos parámetros que /categories: ?after=<id>&limit=N y ?fields=id,name,price
+    if not any(k in request.args for k in ('after', 'limit', 'fields')):
+        products = Product.query.options(joinedload(Product.category)).all()
+        return jsonify([p.to_dict() for p in products])
+
+    fields, error = _parse_fields(PRODUCT_FIELDS)
+    if error:
+        return error
+    page, error = _parse_page()
+    if error:
+        return error
+
+    columns = [Product.id] + [PRODUCT_FIELDS[f] for f in fields if f != 'id']
+    stmt = select(*columns)
+    if 'category_name' in fields:
+        stmt = stmt.outerjoin(Category, Product.category_id == Category.id)
+    rows = _page_rows(stmt, Product.id, page)
+    return _page_response([_project(row, fields, PRODUCT_FIELDS) for row in rows], page)
 
 @catalog_bp.route('/products', methods=['POST'])
 def create_product():
@@ -302,6 +433,38 @@ def create_product():
     db.session.commit()
     return jsonify(new_product.to_dict()), 201
 
+@catalog_bp.route('/products/search', methods=['GET'])
+def search_catalog_products():
+    # ?q=texto&limit=N&offset=M -> productos ordenados por relevancia (índice FTS5, ver app/search.py)
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    # Pedimos uno extra para saber si hay más resultados
+    ranked = search_products(db.session, q, limit + 1, offset)
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+
+    products = {p.id: p for p in Product.query.options(joinedload(Product.category)).filter(
+        Product.id.in_([row[0] for row in ranked])
+    )}
+    items = []
+    for product_id, score in ranked:
+        if product_id in products:
+            item = products[product_id].to_dict()
+            item['score'] = round(-score, 4) if score else 0
+            items.append(item)
+
+    return jsonify({
+        'items': items,
+        'next_offset': offset + limit if has_more else None
+    })
+
 @catalog_bp.route('/products/<int:id>', methods=['GET'])
 def get_product(id):
     product = Product.query.get_or_404(id)
@@ -333,3 +496,77 @@ def delete_product(id):
     return jsonify({'message': 'Product deleted'})
 
 
+
+
+# --- Paginación por cursor y proyección de campos (products / categories) ---
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+PRODUCT_FIELDS = {
+    'id': Product.id,
+    'category_id': Product.category_id,
+    'category_name': Category.name.label('category_name'),
+    'name': Product.name,
+    'description': Product.description,
+    'image_url': Product.image_url,
+    'price': Product.price,
+}
+
+CATEGORY_FIELDS = {
+    'id': Category.id,
+    'name': Category.name,
+    'description': Category.description,
+}
+
+def _parse_fields(allowed, extra=()):
+    """Lee ?fields=a,b,c. Sin el parámetro devuelve todos los campos."""
+    raw = request.args.get('fields')
+    if not raw:
+        return set(allowed) | set(extra), None
+    fields = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = sorted(fields - set(allowed) - set(extra))
+    if unknown:
+        return None, (jsonify({'error': 'Unknown fields', 'fields': unknown}), 400)
+    # El id siempre viaja: es el cursor de la siguiente página
+    fields.add('id')
+    return fields, None
+
+def _parse_page():
+    """Lee ?after=<id>&limit=N. Devuelve None si la request no pide paginación."""
+    if 'after' not in request.args and 'limit' not in request.args:
+        return None, None
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, (jsonify({'error': 'after and limit must be integers'}), 400)
+    return {'after': after, 'limit': max(1, min(limit, MAX_PAGE_SIZE))}, None
+
+def _page_rows(stmt, id_column, page):
+    stmt = stmt.order_by(id_column)
+    if page:
+        # Se pide un registro extra solo para saber si hay página siguiente
+        stmt = stmt.where(id_column > page['after']).limit(page['limit'] + 1)
+    return db.session.execute(stmt).all()
+
+def _project(row, fields, columns):
+    item = {}
+    for f in fields:
+        if f not in columns:
+            continue
+        value = getattr(row, columns[f].key)
+        if f == 'price':
+            value = float(value) if value else 0.0
+        item[f] = value
+    return item
+
+def _page_response(items, page):
+    if not page:
+        return jsonify(items)
+    has_more = len(items) > page['limit']
+    items = items[:page['limit']]
+    return jsonify({
+        'items': items,
+        'next_after': items[-1]['id'] if has_more else None
+    })
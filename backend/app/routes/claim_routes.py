@@ -0,0 +1,163 @@
+from flask import Blueprint, request, jsonify
+from app import db
+from app.extensions import read_only
+from app.models import User, Role
+from app.claims import claim_item, claim_order, claim_batch, ClaimError
+from app.manifest import build_manifest, changes_since, compact_response
+from app.qr_tokens import verify, InvalidToken
+from app.redemption_ledger import ledger, order_key, item_key
+
+claim_bp = Blueprint('claims', __name__)
+
+def _require_scanner():
+    """Valida el token (mismo formato dummy que /api/users/me) y que el usuario sea scanner o admin."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or ' ' not in auth_header:
+        return None, (jsonify({'error': 'No token provided'}), 401)
+
+    token_str = auth_header.split(' ')[1]
+    prefix = "dummy-jwt-token-for-"
+    if not token_str.startswith(prefix):
+        return None, (jsonify({'error': 'Invalid token format'}), 401)
+
+    user = db.session.get(User, token_str[len(prefix):].strip())
+    if not user or not user.is_active:
+        return None, (jsonify({'error': 'User not found'}), 401)
+    if user.role not in (Role.scanner, Role.admin):
+        return None, (jsonify({'error': 'Scanner role required'}), 403)
+    return user, None
+
+def _event_id(data):
+    # Opcional: el escáner indica en qué evento está para rechazar QRs de otro evento
+    return int(data['event_id']) if data.get('event_id') is not None else None
+
+@claim_bp.route('/items/<int:item_id>', methods=['POST'])
+def redeem_item(item_id):
+    # Canje de N unidades de un ítem ("QR Individual"). Body: { quantity?: int = 1, event_id?: int }
+    user, error = _require_scanner()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        quantity = int(data.get('quantity', 1))
+        result = claim_item(db.session, item_id, quantity, _event_id(data))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'quantity and event_id must be integers'}), 400
+    except ClaimError as e:
+        return jsonify(e.to_dict()), e.status_code
+    return jsonify(result)
+
+@claim_bp.route('/orders/<string:order_id>', methods=['POST'])
+def redeem_order(order_id):
+    # Canje de todo lo pendiente de la orden ("QR Global"). Body: { event_id?: int }
+    user, error = _require_scanner()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        result = claim_order(db.session, order_id, _event_id(data))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'event_id must be an integer'}), 400
+    except ClaimError as e:
+        return jsonify(e.to_dict()), e.status_code
+    return jsonify(result)
+
+@claim_bp.route('/scan', methods=['POST'])
+def redeem_token():
+    # Canje a partir del QR firmado. Body: { token: str, event_id?: int, quantity?: int = 1 (solo QR Individual) }
+    # La firma, la expiración y el evento se validan antes de consultar la base de datos.
+    data = request.get_json(silent=True) or {}
+    try:
+        event_id = _event_id(data)
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'quantity and event_id must be integers'}), 400
+    try:
+        claims = verify(data.get('token'), event_id)
+    except InvalidToken as e:
+        return jsonify({'error': str(e)}), 403
+
+    user, error = _require_scanner()
+    if error:
+        return error
+
+    # Reescaneo de un QR ya agotado: se rechaza sin abrir la transacción del canje
+    key = item_key(claims.item_id) if claims.is_item else order_key(claims.order_id)
+    if ledger.contains(db.session, claims.event_id, key):
+        if claims.is_item:
+            rejection = ClaimError('Not enough units left to claim', 409, remaining=0, requested=quantity)
+        else:
+            rejection = ClaimError('Order already fully claimed', 409)
+        return jsonify(rejection.to_dict()), rejection.status_code
+
+    try:
+        if claims.is_item:
+            result = claim_item(db.session, claims.item_id, quantity, claims.event_id)
+        else:
+            result = claim_order(db.session, claims.order_id, claims.event_id)
+    except ClaimError as e:
+        if e.details.get('remaining') == 0 or e.message == 'Order already fully claimed':
+            # Lo agotó otro worker: lo recordamos para el próximo reescaneo
+            ledger.add(claims.event_id, [key])
+        return jsonify(e.to_dict()), e.status_code
+    return jsonify(result)
+
+@claim_bp.route('/ledger-stats', methods=['GET'])
+def get_ledger_stats():
+    return jsonify(ledger.stats())
+
+# --- Modo offline: manifiesto, deltas y canjes en lote ---
+
+MAX_BATCH_SIZE = 500
+
+@claim_bp.route('/events/<int:event_id>/manifest', methods=['GET'])
+@read_only
+def get_manifest(event_id):
+    # { event_id, seq, orders: [order_id], items: [[item_id, índice en orders, saldo]] } (gzip si se acepta)
+    user, error = _require_scanner()
+    if error:
+        return error
+    return compact_response(build_manifest(db.session, event_id))
+
+@claim_bp.route('/events/<int:event_id>/manifest/changes', methods=['GET'])
+@read_only
+def get_manifest_changes(event_id):
+    # ?since=<seq> -> { seq, changes: [[item_id, order_id, saldo]] }; el cliente guarda seq para la próxima vez
+    user, error = _require_scanner()
+    if error:
+        return error
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    return compact_response(changes_since(db.session, event_id, since))
+
+@claim_bp.route('/events/<int:event_id>/sync', methods=['POST'])
+def sync_offline_claims(event_id):
+    # Body: { claims: [ { item_id, quantity?, client_ref? } ], since?: seq }
+    # Responde el resultado de cada canje y, si viene since, los cambios pendientes del manifiesto.
+    user, error = _require_scanner()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    raw_claims = data.get('claims')
+    if not isinstance(raw_claims, list):
+        return jsonify({'error': 'claims must be a list'}), 400
+    if len(raw_claims) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} claims per batch'}), 400
+
+    try:
+        claims = []
+        for c in raw_claims:
+            claim = {'item_id': int(c['item_id']), 'quantity': int(c.get('quantity', 1))}
+            if 'client_ref' in c:
+                claim['client_ref'] = c['client_ref']
+            claims.append(claim)
+        since = int(data['since']) if data.get('since') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each claim needs an integer item_id and quantity'}), 400
+
+    payload = {'results': claim_batch(db.session, claims, event_id)}
+    if since is not None:
+        payload['manifest'] = changes_since(db.session, event_id, since)
+    return compact_response(payload)
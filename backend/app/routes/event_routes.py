@@ -1,73 +1,94 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
-from app.models import Event
+from app.models import Event, Promotion, Contest
+from app.menu_cache import get_menu_snapshot, current_version as current_menu_version
+from app.response_cache import ResponseCache, etag_response
 from datetime import datetime, date, time, timedelta
 from sqlalchemy import or_
+import hashlib
 
 event_bp = Blueprint('events', __name__)
 
+# Cache del listado público, por combinación normalizada de filtros (ver app/response_cache.py)
+events_cache = ResponseCache('events').invalidate_on_commit(Event)
+
+def _normalize_event_filters(args):
+    """Reduce los query params a una tupla canónica: es a la vez la clave de cache y la definición del filtro."""
+    public = args.get('public', '').lower() == 'true'
+
+    filter_type = args.get('filter_type') # 'featured', 'normal'
+    if filter_type not in ('featured', 'normal'):
+        filter_type = None
+
+    def parse_date(value):
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value).date()
+        except ValueError:
+            return None # Ignore invalid dates
+
+    d_from = parse_date(args.get('date_from'))
+    d_to = parse_date(args.get('date_to'))
+
+    # Time Filter (Buckets) - Apply only if no specific date range provided
+    time_filter = None
+    if d_from is None and d_to is None and args.get('time_filter') in ('day', 'week', 'year'):
+        time_filter = args.get('time_filter')
+
+    return (public, filter_type, d_from, d_to, time_filter)
+
 @event_bp.route('', methods=['GET'])
 def get_events():
+    filters = _normalize_event_filters(request.args)
+    body = events_cache.get(filters)
+    if body is None:
+        events = _query_events(*filters)
+        body = current_app.json.dumps([e.to_dict() for e in events], separators=(',', ':')).encode('utf-8')
+        events_cache.set(filters, body)
+    return current_app.response_class(body, mimetype='application/json')
+
+def _query_events(public, filter_type, d_from, d_to, time_filter):
     today = date.today()
     query = Event.query
 
     # Public check
-    if request.args.get('public', '').lower() == 'true':
+    if public:
         query = query.filter(
             Event.is_active == True,
             # valid_from/until filtering removed, relies on is_active for logical elimination
-            # or_(Event.valid_from == None, Event.valid_from <= today),
-            # or_(Event.valid_until == None, Event.valid_until >= today)
         )
 
     # Type Filter
-    filter_type = request.args.get('filter_type') # 'featured', 'normal'
     if filter_type == 'featured':
         query = query.filter(Event.is_featured == True)
     elif filter_type == 'normal':
         query = query.filter(Event.is_featured == False)
 
     # Date Range (Explicit)
-    date_from_str = request.args.get('date_from')
-    date_to_str = request.args.get('date_to')
-    
-    has_explicit_dates = False
-    if date_from_str:
-        try:
-            d_from = datetime.fromisoformat(date_from_str).date()
-            query = query.filter(Event.iso_date >= d_from)
-            has_explicit_dates = True
-        except ValueError:
-            pass # Ignore invalid dates
-        
-    if date_to_str:
-        try:
-            d_to = datetime.fromisoformat(date_to_str).date()
-            query = query.filter(Event.iso_date <= d_to)
-            has_explicit_dates = True
-        except ValueError:
-            pass
-
-    # Time Filter (Buckets) - Apply only if no specific date range provided
-    if not has_explicit_dates:
-        time_filter = request.args.get('time_filter')
-        
-        if time_filter == 'day':
-            query = query.filter(Event.iso_date == today)
-        elif time_filter == 'week':
-            start_week = today - timedelta(days=today.weekday())
-            end_week = start_week + timedelta(days=6)
-            query = query.filter(Event.iso_date >= start_week, Event.iso_date <= end_week)
-        elif time_filter == 'year':
-            start_year = date(today.year, 1, 1)
-            end_year = date(today.year, 12, 31)
-            query = query.filter(Event.iso_date >= start_year, Event.iso_date <= end_year)
+    if d_from:
+        query = query.filter(Event.iso_date >= d_from)
+    if d_to:
+        query = query.filter(Event.iso_date <= d_to)
+
+    if time_filter == 'day':
+        query = query.filter(Event.iso_date == today)
+    elif time_filter == 'week':
+        start_week = today - timedelta(days=today.weekday())
+        end_week = start_week + timedelta(days=6)
+        query = query.filter(Event.iso_date >= start_week, Event.iso_date <= end_week)
+    elif time_filter == 'year':
+        start_year = date(today.year, 1, 1)
+        end_year = date(today.year, 12, 31)
+        query = query.filter(Event.iso_date >= start_year, Event.iso_date <= end_year)
 
     # Ordering: Featured first, then date
     query = query.order_by(Event.is_featured.desc(), Event.iso_date.asc())
+    return query.all()
 
-    events = query.all()
-    return jsonify([e.to_dict() for e in events])
+@event_bp.route('/cache-stats', methods=['GET'])
+def get_events_cache_stats():
+    return jsonify(events_cache.stats())
 
 @event_bp.route('/featured', methods=['GET'])
 def get_featured_events():
@@ -85,10 +106,45 @@ def get_event(id):
 
 @event_bp.route('/<int:id>/menu', methods=['GET'])
 def get_event_menu(id):
-    event = Event.query.get_or_404(id)
-    if not event.menu:
+    Event.query.get_or_404(id)
+    snapshot = get_menu_snapshot(id)
+    if not snapshot:
         return jsonify({'message': 'Menu not found for this event'}), 404
-    return jsonify(event.menu.to_dict())
+    return etag_response(snapshot.body, snapshot.etag)
+
+# Bundle de la página del evento: evento + carta + promociones y concursos activos en una sola respuesta.
+# La clave incluye la versión de la carta, así un cambio de carta genera una entrada nueva de inmediato.
+bundle_cache = ResponseCache('event_bundle').invalidate_on_commit(Event, Promotion, Contest)
+
+@event_bp.route('/<int:id>/bundle', methods=['GET'])
+def get_event_bundle(id):
+    key = (id, current_menu_version(id))
+    cached = bundle_cache.get(key)
+    if cached is None:
+        event = Event.query.get_or_404(id)
+        snapshot = get_menu_snapshot(id)
+        promotions = Promotion.query.filter_by(active=True).order_by(Promotion.id).all()
+        contests = Contest.query.filter_by(active=True).order_by(Contest.id).all()
+
+        def dumps(obj):
+            return current_app.json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+        # La carta ya viene serializada en el snapshot: se concatena sin volver a pasar por json
+        body = b''.join([
+            b'{"event":', dumps(event.to_dict()),
+            b',"menu":', snapshot.body if snapshot else b'null',
+            b',"promotions":', dumps([p.to_dict() for p in promotions]),
+            b',"contests":', dumps([c.to_dict() for c in contests]),
+            b'}',
+        ])
+        cached = (body, f"bundle-{id}-{key[1]}-{hashlib.sha1(body).hexdigest()[:16]}")
+        bundle_cache.set(key, cached)
+
+    return etag_response(*cached)
+
+@event_bp.route('/bundle-cache-stats', methods=['GET'])
+def get_bundle_cache_stats():
+    return jsonify(bundle_cache.stats())
 
 
 @event_bp.route('', methods=['POST'])
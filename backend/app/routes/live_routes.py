@@ -0,0 +1,37 @@
+from flask import Blueprint, Response, request, jsonify
+from app.live_events import ENABLED, broker, parse_topics, stream
+
+live_bp = Blueprint('live', __name__)
+
+@live_bp.route('/stream', methods=['GET'])
+def live_stream():
+    # ?topics=dashboard,order:<order_id>,event:<event_id> -> text/event-stream
+    # Al reconectar, EventSource manda Last-Event-ID; ?last_event_id= sirve para clientes que no lo hacen.
+    if not ENABLED:
+        return jsonify({'error': 'Live events are disabled (LIVE_EVENTS=0)'}), 404
+    try:
+        topics = parse_topics(request.args.get('topics'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_seq = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    subscription = broker.subscribe(topics, last_seq)
+    if subscription is None:
+        response = jsonify({'error': 'Too many live connections, retry later'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    subscriber, backlog = subscription
+
+    # El generador no usa la sesión ni el contexto de la request: no retiene conexiones del pool
+    return Response(stream(subscriber, backlog, last_seq), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Nginx: no acumular el stream en el buffer del proxy
+    })
+
+@live_bp.route('/stats', methods=['GET'])
+def get_live_stats():
+    return jsonify(broker.stats())
@@ -1,7 +1,11 @@
 from flask import Blueprint, jsonify
+from app import db
+from app.db_profile import describe
 
 main = Blueprint('main', __name__)
 
 @main.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Flask backend is running!'})
+    with db.engine.connect() as connection:
+        database = describe(connection)
+    return jsonify({'status': 'healthy', 'message': 'Flask backend is running!', 'database': database})
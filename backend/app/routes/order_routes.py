@@ -1,17 +1,145 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, stream_with_context
 from app import db
-from app.models import Order, OrderItem, OrderStatus
-from datetime import datetime, time
+from app.extensions import read_only, reading_only
+from sqlalchemy import String, case, func, insert, select, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import Event, Order, OrderItem, OrderStatus
+from app.menu_cache import get_price_table
+from app.claims import CLAIMABLE_STATUSES
+from app.qr_tokens import order_token, item_token
+from app.idempotency import idempotent
+from app.write_queue import order_writes
+from app.order_archive import sources
+from app.live_events import publish_dashboard, publish_order_status
+from datetime import date, datetime, time, timedelta
+import csv
+import functools
+import io
+import json
 import uuid
 
 order_bp = Blueprint('orders', __name__)
 
 @order_bp.route('/', methods=['GET'])
+@read_only
 def get_orders():
-    orders = Order.query.all()
-    return jsonify([o.to_dict() for o in orders])
+    # Filtros opcionales: ?event_id=&status=&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD (fecha de compra, UTC)
+    # Con ?limit= / ?after= responde resúmenes paginados (ver _summary_page)
+    orders, items = sources()
+    filters, error = _parse_order_filters(orders)
+    if error:
+        return error
+    page, error = _parse_order_page()
+    if error:
+        return error
+    if page:
+        return _summary_page(orders, items, filters, page)
+
+    return jsonify([o.to_dict() for o in _load_orders(orders, items, filters)])
+
+def _load_orders(orders, items, filters):
+    """Órdenes con sus ítems, más nuevas primero. `orders`/`items` vienen de sources()."""
+    query = (db.session.query(orders)
+             .filter(*filters)
+             .order_by(orders.created_at.desc(), orders.order_id.desc()))
+    if orders is Order:
+        return query.options(selectinload(Order.items)).all()
+
+    # Sobre las vistas UNION la relación Order.items solo vería el archivo principal: cargamos los ítems aparte
+    result = query.all()
+    by_order = {}
+    for item in (db.session.query(items)
+                 .join(orders, orders.order_id == items.order_id)
+                 .filter(*filters)
+                 .order_by(items.id)):
+        by_order.setdefault(item.order_id, []).append(item)
+    for order in result:
+        set_committed_value(order, 'items', by_order.get(order.order_id, []))
+    return result
+
+EXPORT_CHUNK_SIZE = 2000
+
+def _export_columns(orders, items):
+    return [
+        ('order_id', orders.order_id),
+        ('user_id', orders.user_id),
+        ('event_id', orders.event_id),
+        ('iso_date', orders.iso_date),
+        ('purchase_time', orders.purchase_time),
+        ('created_at', orders.created_at),
+        ('status', orders.status),
+        ('order_total', orders.total),
+        ('item_id', items.id),
+        ('product_id', items.product_id),
+        ('product_name', items.product_name),
+        ('quantity', items.quantity),
+        ('claimed', items.claimed),
+        ('price_at_purchase', items.price_at_purchase),
+    ]
+
+def _export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, OrderStatus):
+        return value.value
+    if value is not None and not isinstance(value, (int, str)):
+        return float(value)  # Numeric -> Decimal
+    return value
+
+@order_bp.route('/export', methods=['GET'])
+@read_only
+def export_orders():
+    # Una fila por ítem (con los datos de su orden) para conciliar pagos Webpay.
+    # ?format=ndjson|csv y los mismos filtros que el listado: event_id, status, date_from, date_to.
+    # Se transmite por bloques de EXPORT_CHUNK_SIZE filas: la memoria no crece con el tamaño del evento.
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    orders, items = sources()
+    filters, error = _parse_order_filters(orders)
+    if error:
+        return error
+
+    columns = _export_columns(orders, items)
+    names = [name for name, _ in columns]
+    stmt = (
+        select(*[column for _, column in columns])
+        .outerjoin(items, items.order_id == orders.order_id)
+        .where(*filters)
+        .order_by(orders.created_at, orders.order_id, items.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+    def generate():
+        # Corre después de que la vista retornó (y @read_only restauró el flag): se vuelve a marcar aquí
+        with reading_only():
+            result = db.session.execute(stmt)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                writer.writerow(names)
+            for chunk in result.partitions():
+                for row in chunk:
+                    values = [_export_value(v) for v in row]
+                    if export_format == 'csv':
+                        writer.writerow(values)
+                    else:
+                        buffer.write(json.dumps(dict(zip(names, values)), separators=(',', ':')))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=orders.{export_format}'
+    return response
 
 @order_bp.route('/my-history', methods=['GET'])
+@read_only
 def get_my_history():
     auth_header = request.headers.get('Authorization')
     if not auth_header:
@@ -28,19 +156,50 @@ def get_my_history():
         # user = User.query.get(user_id)
         # if not user: ...
         
-        orders = Order.query.filter_by(user_id=user_id).all()
-        # Idealmente ordenar por fecha
-        return jsonify([o.to_dict() for o in orders])
+        orders, items = sources()
+        page, error = _parse_order_page()
+        if error:
+            return error
+        if page:
+            return _summary_page(orders, items, [orders.user_id == user_id], page)
+
+        return jsonify([o.to_dict() for o in _load_orders(orders, items, [orders.user_id == user_id])])
         
     except IndexError:
         return jsonify({'error': 'Invalid token header'}), 401
 
 @order_bp.route('/<string:id>', methods=['GET'])
 def get_order(id):
-    order = Order.query.get_or_404(id)
+    orders, items = sources()
+    if orders is Order:
+        order = Order.query.get_or_404(id)
+    else:
+        found = _load_orders(orders, items, [orders.order_id == id])
+        if not found:
+            return jsonify({'error': 'Order not found'}), 404
+        order = found[0]
     return jsonify(order.to_dict())
 
+@order_bp.route('/<string:id>/qr', methods=['GET'])
+def get_order_qr(id):
+    # Tokens firmados para "QR Global" (toda la orden) y "QR Individual" (un token por ítem)
+    order = Order.query.options(selectinload(Order.items)).get_or_404(id)
+    if order.status not in CLAIMABLE_STATUSES:
+        return jsonify({'error': 'Order is not claimable', 'status': order.status.value if order.status else None}), 409
+
+    event = db.session.get(Event, order.event_id)
+    return jsonify({
+        'order_id': order.order_id,
+        'event_id': order.event_id,
+        'global': order_token(order, event),
+        'items': [
+            {'item_id': item.id, 'product_name': item.product_name, 'token': item_token(order, event, item.id)}
+            for item in order.items
+        ]
+    })
+
 @order_bp.route('/', methods=['POST'])
+@idempotent('orders.create')
 def create_order():
 
     #https://www.transbankdevelopers.cl/documentacion/como_empezar#como-empezar
@@ -76,38 +235,254 @@ def create_order():
         
         status = OrderStatus(data.get('status', 'COMPLETED'))
         
-        new_order = Order(
-            order_id=order_id,
-            user_id=data['user_id'],
-            event_id=data['event_id'],
-            iso_date=iso_date,
-            purchase_time=purchase_time,
-            total=data['total'],
-            status=status,
-            qr_code_data=data.get('qr_code_data')
-        )
-        
-        db.session.add(new_order)
+        order_row = {
+            'order_id': order_id,
+            'user_id': data['user_id'],
+            'event_id': data['event_id'],
+            'iso_date': iso_date,
+            'purchase_time': purchase_time,
+            'total': data['total'],
+            'status': status,
+            'qr_code_data': data.get('qr_code_data'),
+            'created_at': datetime.utcnow(),
+        }
         
         # Add items
+        rows = []
         for item_data in data['items']:
             # Validation for each item could go here
-            new_item = OrderItem(
-                order_id=order_id,
+            rows.append({
+                'order_id': order_id,
                 # variation_id -> product_id mapping if needed, but for now just storing what frontend sends
-                product_id=item_data.get('product_id'), # Assuming refactor
-                product_name=item_data['product_name'],
+                'product_id': item_data.get('product_id'), # Assuming refactor
+                'product_name': item_data['product_name'],
                 # variation_name removed or optional
-                quantity=item_data['quantity'],
-                price_at_purchase=item_data['price']
-            )
-            db.session.add(new_item)
+                'quantity': item_data['quantity'],
+                'claimed': 0,
+                'price_at_purchase': item_data['price'],
+            })
 
-        db.session.commit()
-        return jsonify(new_order.to_dict()), 201
+        item_ids = _save_order(order_row, rows)
 
+    except IntegrityError as e:
+        # Solo el order_id repetido es un conflicto; otras restricciones siguen siendo un 500
+        if 'orders.order_id' in str(e.orig):
+            return jsonify({'error': 'Order already exists'}), 409
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         import traceback
         traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(_order_dict(order_row, rows, item_ids)), 201
+
+def _insert_order(connection, order_row, rows):
+    """Un INSERT para la orden y uno multi-VALUES para sus ítems. Devuelve los ids de los ítems."""
+    connection.execute(insert(Order).values(**order_row))
+    item_ids = []
+    if rows:
+        # Con una lista vacía executemany no aplica: sería un INSERT de una fila con valores por defecto
+        item_ids = connection.execute(
+            insert(OrderItem).returning(OrderItem.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    # Aviso por SSE en la misma transacción (ver app/live_events.py)
+    publish_order_status(connection, order_row['order_id'], order_row['event_id'], order_row['status'])
+    publish_dashboard(connection)
+    return item_ids
+
+def _save_order(order_row, rows):
+    # Con ORDER_GROUP_COMMIT=1 la inserción se confirma junto con las de otras requests (ver app/write_queue.py)
+    if order_writes.enabled:
+        return order_writes.run(functools.partial(_insert_order, order_row=order_row, rows=rows))
+    try:
+        item_ids = _insert_order(db.session.connection(), order_row, rows)
+        db.session.commit()
+    except Exception:
         db.session.rollback()
+        raise
+    return item_ids
+
+def _order_dict(order_row, rows, item_ids):
+    # Objetos transitorios (fuera de la sesión), solo para reutilizar to_dict sin releer la orden
+    order = Order(**order_row)
+    order.items = [OrderItem(id=item_id, **row) for item_id, row in zip(item_ids, rows)]
+    return order.to_dict()
+
+
+@order_bp.route('/checkout', methods=['POST'])
+@idempotent('orders.checkout')
+def checkout():
+    # Checkout con precios del servidor: el cliente solo manda qué y cuánto.
+    # { user_id, event_id, items: [ { menu_product_id, quantity } ], status?, order_id? }
+    data = request.get_json()
+    if not data or not all(k in data for k in ('user_id', 'event_id', 'items')):
+        return jsonify({'error': 'Missing required fields'}), 400
+    if not isinstance(data['items'], list) or not data['items']:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+
+    # Agrupamos por menu_product_id por si el carrito trae la misma línea repetida
+    quantities = {}
+    try:
+        for item in data['items']:
+            mp_id = int(item['menu_product_id'])
+            quantity = int(item['quantity'])
+            if quantity <= 0:
+                raise ValueError
+            quantities[mp_id] = quantities.get(mp_id, 0) + quantity
+        event_id = int(data['event_id'])
+        status = OrderStatus(data.get('status', 'COMPLETED'))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each item needs menu_product_id and a positive quantity'}), 400
+
+    # Precios desde la tabla en memoria de la carta del evento (se recalcula solo si cambió la carta)
+    prices = get_price_table(event_id)
+    if prices is None:
+        return jsonify({'error': 'Menu not found for this event'}), 404
+    unavailable = sorted(mp_id for mp_id in quantities if mp_id not in prices)
+    if unavailable:
+        return jsonify({'error': 'Products not available in this event menu', 'ids': unavailable}), 400
+
+    order_id = data.get('order_id', f"ORD-{uuid.uuid4().hex[:12]}")
+    now = datetime.now()
+    rows = [
+        {
+            'order_id': order_id,
+            'product_id': prices[mp_id].product_id,
+            'product_name': prices[mp_id].product_name,
+            'quantity': quantity,
+            'claimed': 0,
+            'price_at_purchase': prices[mp_id].price,
+        }
+        for mp_id, quantity in quantities.items()
+    ]
+    total = sum(row['price_at_purchase'] * row['quantity'] for row in rows)
+
+    # created_at se fija aquí (UTC, igual que CURRENT_TIMESTAMP) para responder sin releer la orden. Con
+    # microsegundos: es la clave del keyset y las órdenes del mismo segundo deben quedar en orden de creación.
+    order_row = {
+        'order_id': order_id,
+        'user_id': data['user_id'],
+        'event_id': event_id,
+        'iso_date': now.date(),
+        'purchase_time': now.time(),
+        'total': total,
+        'status': status,
+        'qr_code_data': data.get('qr_code_data'),
+        'created_at': datetime.utcnow(),
+    }
+    try:
+        item_ids = _save_order(order_row, rows)
+    except IntegrityError:
+        return jsonify({'error': 'Order already exists'}), 409
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+    return jsonify(_order_dict(order_row, rows, item_ids)), 201
+
+# --- Listados paginados por keyset: resúmenes primero, ítems solo de las órdenes expandidas ---
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def _created_key(orders):
+    # created_at se compara como el texto guardado en SQLite: las filas con server_default no llevan
+    # microsegundos, así que un datetime como parámetro no coincidiría con el cursor exacto.
+    return type_coerce(orders.created_at, String)
+
+def _parse_order_filters(orders=Order):
+    filters = []
+    created_key = _created_key(orders)
+    try:
+        if request.args.get('event_id'):
+            filters.append(orders.event_id == int(request.args['event_id']))
+        if request.args.get('status'):
+            filters.append(orders.status == OrderStatus(request.args['status']))
+        if request.args.get('date_from'):
+            filters.append(created_key >= date.fromisoformat(request.args['date_from']).isoformat())
+        if request.args.get('date_to'):
+            day_after = date.fromisoformat(request.args['date_to']) + timedelta(days=1)
+            filters.append(created_key < day_after.isoformat())
+    except ValueError:
+        return None, (jsonify({'error': 'Invalid event_id, status or date filter'}), 400)
+    return filters, None
+
+def _parse_order_page():
+    """Lee ?after=<cursor>&limit=N&expand=id1,id2. Devuelve None si la request no pide paginación."""
+    if 'after' not in request.args and 'limit' not in request.args:
+        return None, None
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, (jsonify({'error': 'limit must be an integer'}), 400)
+
+    after = None
+    if request.args.get('after'):
+        # Cursor "<created_at>|<order_id>" tal como lo entregó next_after
+        created_key, sep, order_id = request.args['after'].partition('|')
+        if not sep:
+            return None, (jsonify({'error': 'Invalid after cursor'}), 400)
+        after = (created_key, order_id)
+
+    expand = {i.strip() for i in request.args.get('expand', '').split(',') if i.strip()}
+    return {'after': after, 'limit': max(1, min(limit, MAX_PAGE_SIZE)), 'expand': expand}, None
+
+def _summary_page(orders, items, filters, page):
+    # 1) La página sale del índice (filtro, created_at, order_id) con un registro extra para saber si hay más
+    created = _created_key(orders)
+    keyset = select(orders.order_id, orders.user_id, orders.event_id, orders.iso_date, orders.purchase_time,
+                    orders.total, orders.status, created.label('created_key')).where(*filters)
+    if page['after']:
+        created_key, order_id = page['after']
+        keyset = keyset.where(
+            (created < created_key) | ((created == created_key) & (orders.order_id < order_id))
+        )
+    keyset = keyset.order_by(created.desc(), orders.order_id.desc()).limit(page['limit'] + 1).subquery()
+
+    # 2) Conteos y saldo por canjear de esa página en la misma consulta agregada
+    pending = func.coalesce(func.sum(items.quantity - func.coalesce(items.claimed, 0)), 0)
+    rows = db.session.execute(
+        select(
+            keyset,
+            func.coalesce(func.sum(items.quantity), 0).label('item_count'),
+            case((keyset.c.status.in_(CLAIMABLE_STATUSES), pending), else_=0).label('remaining'),
+        )
+        .outerjoin(items, items.order_id == keyset.c.order_id)
+        .group_by(*keyset.c)
+        .order_by(keyset.c.created_key.desc(), keyset.c.order_id.desc())
+    ).all()
+
+    has_more = len(rows) > page['limit']
+    rows = rows[:page['limit']]
+
+    # 3) Ítems solo de las órdenes que el cliente expandió (y que están en esta página)
+    expanded = page['expand'] & {r.order_id for r in rows}
+    items_by_order = {}
+    if expanded:
+        for item in db.session.query(items).filter(items.order_id.in_(expanded)).order_by(items.id):
+            items_by_order.setdefault(item.order_id, []).append(item.to_dict())
+
+    summaries = []
+    for r in rows:
+        summary = {
+            'order_id': r.order_id,
+            'user_id': r.user_id,
+            'event_id': r.event_id,
+            'iso_date': r.iso_date.isoformat() if r.iso_date else None,
+            'purchase_time': r.purchase_time.isoformat() if r.purchase_time else None,
+            'total': float(r.total) if r.total else 0.0,
+            'status': r.status.value if r.status else None,
+            'created_at': datetime.fromisoformat(r.created_key).isoformat() if r.created_key else None,
+            'item_count': r.item_count,
+            'remaining': r.remaining,
+        }
+        if r.order_id in expanded:
+            summary['items'] = items_by_order.get(r.order_id, [])
+        summaries.append(summary)
+
+    last = rows[-1] if rows else None
+    return jsonify({
+        'items': summaries,
+        'next_after': f"{last.created_key}|{last.order_id}" if has_more else None
+    })
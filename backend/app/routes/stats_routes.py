@@ -1,76 +1,42 @@
-from flask import Blueprint, jsonify
-from ..models import db, User, Event, Order, OrderItem
-from sqlalchemy import func
-from datetime import datetime, date, timedelta
+from flask import Blueprint, jsonify, request
+from ..models import db, User, Event
+from ..order_archive import sources
+from ..extensions import read_only
+from ..manifest import compact_response
+from ..sales_analytics import event_sales
+from ..sales_rollups import dashboard_counters
+from sqlalchemy import literal, select, String, tuple_, type_coerce, union_all
+from datetime import datetime, date
 
 stats_bp = Blueprint('stats', __name__)
 
+DASHBOARD_ACTIVITY = 5
+DEFAULT_ACTIVITY_PAGE = 20
+MAX_ACTIVITY_PAGE = 100
+
 @stats_bp.route('/dashboard', methods=['GET'])
+@read_only
 def get_dashboard_stats():
     today = date.today()
-    first_day_of_month = today.replace(day=1)
     
     # 1. Usuarios Totales (Total Count)
     total_users = User.query.count()
     
-    # 2. Ventas del Mes (Suma de Order.total para orders creadas este mes)
-    sales_month_query = db.session.query(func.sum(Order.total)).filter(
-        Order.created_at >= first_day_of_month
-    ).scalar()
-    sales_month = float(sales_month_query) if sales_month_query else 0.0
-    
+    # 2 y 5. Ventas del Mes y Tickets Vendidos Hoy, desde los acumulados diarios que mantienen triggers
+    #    (ver app/sales_rollups.py): pocas filas por clave primaria, sin recorrer orders. Sin órdenes canceladas.
+    #    Nota: Usamos "Vendidos Hoy" porque no tenemos timestamp de "Canjeado Hoy" en el modelo actual.
+    counters = dashboard_counters(db.session, today)
+    sales_month = counters['sales_month']
+    tickets_sold_today = counters['tickets_sold_today']
+
     # 3. Eventos Destacados
     featured_events = Event.query.filter(Event.is_featured == True).count()
 
     # 4. Eventos Activos
     active_events = Event.query.filter(Event.is_active == True).count()
     
-    # 5. Tickets Vendidos Hoy (Suma de cantidad de items en orders de hoy)
-    # Nota: Usamos "Vendidos Hoy" porque no tenemos timestamp de "Canjeado Hoy" en el modelo actual.
-    start_of_day = datetime.combine(today, datetime.min.time())
-    tickets_sold_today_query = db.session.query(func.sum(OrderItem.quantity)).join(Order).filter(
-        Order.created_at >= start_of_day
-    ).scalar()
-    tickets_sold_today = int(tickets_sold_today_query) if tickets_sold_today_query else 0
-    
-    # 6. Actividad Reciente
-    # Uniremos ultimos usuarios y ultimas ordenes
-    recent_activity = []
-    
-    # Ultimos 3 usuarios
-    last_users = User.query.order_by(User.created_at.desc()).limit(3).all()
-    for u in last_users:
-        recent_activity.append({
-            'action': 'Nuevo usuario registrado',
-            'user': u.name,
-            'time': u.created_at, # Enviaremos objeto datetime, luego ordenamos
-            'type': 'user'
-        })
-        
-    # Ultimas 3 ordenes
-    last_orders = Order.query.order_by(Order.created_at.desc()).limit(3).all()
-    for o in last_orders:
-        user_name = "Usuario" # Si quisieramos el nombre tendriamos que hacer query al user_id
-        # Intentamos obtener nombre del user si es posible, aunque user_id es string en Order
-        u = User.query.get(o.user_id)
-        if u:
-            user_name = u.name
-            
-        recent_activity.append({
-            'action': f'Compra ticket #{o.order_id[:8]}...',
-            'user': user_name,
-            'time': o.created_at,
-            'type': 'order'
-        })
-
-    # Ordenar por tiempo descendente y tomar los top 5
-    recent_activity.sort(key=lambda x: x['time'], reverse=True)
-    recent_activity = recent_activity[:5]
-    
-    # Formatear fecha para JSON
-    for item in recent_activity:
-        # Calculo simple de "hace X tiempo" podria hacerse en frontend, aqui mandamos ISO string
-        item['time'] = item['time'].isoformat() if item['time'] else datetime.now().isoformat()
+    # 6. Actividad Reciente: usuarios nuevos y compras en una sola consulta (ver _activity_page)
+    recent_activity, _ = _activity_page(DASHBOARD_ACTIVITY)
 
     return jsonify({
         'stats': [
@@ -82,3 +48,97 @@ def get_dashboard_stats():
         ],
         'recentActivity': recent_activity
     })
+
+@stats_bp.route('/activity', methods=['GET'])
+@read_only
+def get_activity():
+    # ?limit=N&after=<cursor> -> { items, next_after }; el cliente pide la siguiente página con next_after
+    try:
+        limit = int(request.args.get('limit', DEFAULT_ACTIVITY_PAGE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    after = None
+    if request.args.get('after'):
+        # Cursor "<created_at>|<type>|<id>" tal como lo entregó next_after
+        created_key, sep, rest = request.args['after'].partition('|')
+        kind, sep2, ref = rest.partition('|')
+        if not sep or not sep2 or kind not in ('user', 'order'):
+            return jsonify({'error': 'Invalid after cursor'}), 400
+        after = (created_key, kind, ref)
+
+    items, next_after = _activity_page(max(1, min(limit, MAX_ACTIVITY_PAGE)), after)
+    return jsonify({'items': items, 'next_after': next_after})
+
+
+@stats_bp.route('/events/<int:event_id>/sales', methods=['GET'])
+@read_only
+def get_event_sales(event_id):
+    # ?bucket_minutes=15 -> ventas por producto y bucket en arreglos (ver app/sales_analytics.py)
+    try:
+        bucket_minutes = int(request.args.get('bucket_minutes', 15))
+    except ValueError:
+        return jsonify({'error': 'bucket_minutes must be an integer'}), 400
+    if not 1 <= bucket_minutes <= 1440:
+        return jsonify({'error': 'bucket_minutes must be between 1 and 1440'}), 400
+
+    event = db.session.get(Event, event_id)
+    if event is None:
+        return jsonify({'error': 'Event not found'}), 404
+    return compact_response(event_sales(db.session, event, bucket_minutes))
+
+
+def _activity_branch(kind, ref, created, query, limit, after):
+    """Una rama del feed, ya cortada en `limit` filas por el índice (created_at, id, ...)."""
+    if after:
+        created_key, after_kind, after_ref = after
+        # Orden global (created_at, type, id) descendente; `kind` es constante dentro de la rama
+        if kind < after_kind:
+            query = query.where(created <= created_key)
+        elif kind == after_kind:
+            query = query.where(tuple_(created, ref) < tuple_(created_key, after_ref))
+        else:
+            query = query.where(created < created_key)
+    return select(query.order_by(created.desc(), ref.desc()).limit(limit).subquery())
+
+
+def _activity_page(limit, after=None):
+    """Feed de actividad (usuarios nuevos y compras), más reciente primero. Devuelve (items, next_after)."""
+    # Órdenes de todos los eventos, incluidas las archivadas (ver app/order_archive.py)
+    orders, _ = sources()
+    # created_at como el texto guardado (ver _created_key en order_routes): el cursor debe coincidir exacto
+    user_created = type_coerce(User.created_at, String)
+    order_created = type_coerce(orders.created_at, String)
+
+    users_q = select(
+        literal('user').label('type'), User.id.label('ref'), User.name.label('user_name'),
+        user_created.label('created_key'),
+    )
+    orders_q = select(
+        literal('order').label('type'), orders.order_id.label('ref'), User.name.label('user_name'),
+        order_created.label('created_key'),
+    ).select_from(orders).outerjoin(User, User.id == orders.user_id)
+
+    # Cada rama trae a lo más limit + 1 filas; el UNION ALL ordena solo esas
+    feed = union_all(
+        _activity_branch('user', User.id, user_created, users_q, limit + 1, after),
+        _activity_branch('order', orders.order_id, order_created, orders_q, limit + 1, after),
+    ).subquery()
+    rows = db.session.execute(
+        select(feed).order_by(feed.c.created_key.desc(), feed.c.type.desc(), feed.c.ref.desc()).limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        {
+            'id': r.ref,
+            'action': 'Nuevo usuario registrado' if r.type == 'user' else f'Compra ticket #{r.ref[:8]}...',
+            'user': r.user_name or 'Usuario',
+            'time': datetime.fromisoformat(r.created_key).isoformat() if r.created_key else None,
+            'type': r.type,
+        }
+        for r in rows
+    ]
+    last = rows[-1] if rows else None
+    return items, (f"{last.created_key}|{last.type}|{last.ref}" if has_more else None)
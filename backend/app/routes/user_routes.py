@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from app import db
+from app.extensions import read_only
 from app.models import User, Role, Gender
 from datetime import datetime
 import uuid
@@ -7,6 +8,7 @@ import uuid
 user_bp = Blueprint('users', __name__)
 
 @user_bp.route('/', methods=['GET'])
+@read_only
 def get_users():
     users = User.query.all()
     return jsonify([u.to_dict() for u in users])
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, redirect
 from app import db
-from app.models import Order, OrderStatus
+from app.models import Event, Order, OrderStatus
+from app.qr_tokens import order_token
+from app.idempotency import idempotent
+from app.live_events import publish_dashboard, publish_order_status
 from transbank.webpay.webpay_plus.transaction import Transaction
 from transbank.common.options import WebpayOptions
 from transbank.common.integration_commerce_codes import IntegrationCommerceCodes
@@ -28,6 +31,7 @@ def get_transaction():
         return Transaction(WebpayOptions(CC_TEST, KEY_TEST, IntegrationType.TEST))
 
 @webpay_bp.route('/create', methods=['POST'])
+@idempotent('webpay.create')
 def create_transaction():
     try:
         data = request.get_json()
@@ -92,13 +96,17 @@ def return_transaction():
         if status == 'AUTHORIZED' and response_code == 0:
              if order:
                  order.status = OrderStatus.COMPLETED
-                 order.qr_code_data = f"TBK|{token}|{buy_order}"
+                 order.qr_code_data = order_token(order, db.session.get(Event, order.event_id))
+                 publish_order_status(db.session, order.order_id, order.event_id, order.status)
+                 publish_dashboard(db.session)
                  db.session.commit()
                  print(f"Order {buy_order} COMPLETED")
              return redirect(f"http://localhost:5173/payment/success?orderId={buy_order}")
         else:
              if order:
                  order.status = OrderStatus.CANCELLED
+                 publish_order_status(db.session, order.order_id, order.event_id, order.status)
+                 publish_dashboard(db.session)
                  db.session.commit()
                  print(f"Order {buy_order} FAILED/CANCELLED")
              return redirect(f"http://localhost:5173/payment/failure?orderId={buy_order}")
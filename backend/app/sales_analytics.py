@@ -0,0 +1,141 @@
+"""Ventas por producto en buckets de tiempo (15 min por defecto) para un evento.
+
+Una sola consulta trae las columnas que hacen falta (instante de compra en
+segundos, product_id, cantidad, precio) de las órdenes no canceladas del
+evento, incluidas las archivadas (app/order_archive.py). Con NumPy (opcional,
+no está en requirements.txt) la consulta se lee directo a arreglos y el
+agregado es un bincount; sin NumPy, o con SALES_ANALYTICS_ENGINE=sql, SQLite
+agrupa con GROUP BY. Ambos caminos entregan el mismo resultado.
+
+La respuesta es columnar: los buckets con ventas como desplazamientos desde
+`start`, y por producto una fila de cantidades y otra de montos alineadas con
+esos buckets, en vez de una lista de diccionarios por fila.
+
+Los eventos terminados (fin del evento + FINISHED_GRACE) ya no reciben
+compras, así que su resultado se guarda sin vencimiento en cada worker.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, select
+
+from .models import OrderStatus, Product
+from .order_archive import sources
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ENGINE = os.getenv('SALES_ANALYTICS_ENGINE', 'numpy' if numpy is not None else 'sql')
+FINISHED_GRACE = timedelta(hours=2)
+MAX_CACHED_EVENTS = 256
+
+# Fecha y hora locales de la compra como segundos "epoch" (sin zona): los buckets caen en :00, :15...
+_PURCHASE_SECONDS = "CAST(strftime('%s', o.iso_date || ' ' || coalesce(o.purchase_time, '00:00:00')) AS INTEGER)"
+
+_EPOCH = datetime(1970, 1, 1)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def finished_at(event):
+    """Fin del evento más FINISHED_GRACE; los eventos que cruzan la medianoche terminan al día siguiente."""
+    end = datetime.combine(event.iso_date, event.end_time)
+    if event.end_time <= event.start_time:
+        end += timedelta(days=1)
+    return end + FINISHED_GRACE
+
+
+def _rows_sql(bucket_seconds, grouped):
+    orders, items = (inspect(entity).selectable.name for entity in sources())
+    where = f"o.event_id = ? AND o.status IS NOT '{OrderStatus.CANCELLED.name}'"
+    source = f"FROM {orders} o JOIN {items} i ON i.order_id = o.order_id WHERE {where}"
+    if grouped:
+        return (f"SELECT {_PURCHASE_SECONDS} / {bucket_seconds} AS bucket, i.product_id, "
+                f"sum(i.quantity), sum(i.quantity * i.price_at_purchase) {source} "
+                f"GROUP BY bucket, i.product_id ORDER BY bucket, i.product_id")
+    return f"SELECT {_PURCHASE_SECONDS}, i.product_id, i.quantity, i.price_at_purchase {source}"
+
+
+def _aggregate_numpy(cursor, event_id, bucket_seconds):
+    cursor.execute(_rows_sql(bucket_seconds, grouped=False), (event_id,))
+    rows = numpy.fromiter(cursor, dtype=[('ts', 'i8'), ('product', 'i8'), ('quantity', 'i8'), ('price', 'f8')])
+    buckets, bucket_index = numpy.unique(rows['ts'] // bucket_seconds, return_inverse=True)
+    products, product_index = numpy.unique(rows['product'], return_inverse=True)
+
+    cells = product_index * len(buckets) + bucket_index
+    shape = (len(products), len(buckets))
+    quantity = numpy.bincount(cells, weights=rows['quantity'], minlength=shape[0] * shape[1])
+    revenue = numpy.bincount(cells, weights=rows['quantity'] * rows['price'], minlength=shape[0] * shape[1])
+    return (
+        buckets.tolist(),
+        products.tolist(),
+        quantity.reshape(shape).astype('i8').tolist(),
+        revenue.reshape(shape).round(2).tolist(),
+    )
+
+
+def _aggregate_sql(cursor, event_id, bucket_seconds):
+    cursor.execute(_rows_sql(bucket_seconds, grouped=True), (event_id,))
+    rows = cursor.fetchall()
+    buckets = sorted({r[0] for r in rows})
+    products = sorted({r[1] for r in rows})
+    bucket_index = {b: n for n, b in enumerate(buckets)}
+    product_index = {p: n for n, p in enumerate(products)}
+
+    quantity = [[0] * len(buckets) for _ in products]
+    revenue = [[0.0] * len(buckets) for _ in products]
+    for bucket, product, qty, amount in rows:
+        quantity[product_index[product]][bucket_index[bucket]] = qty
+        revenue[product_index[product]][bucket_index[bucket]] = round(float(amount), 2)
+    return buckets, products, quantity, revenue
+
+
+def event_sales(session, event, bucket_minutes=15, now=None):
+    """Ventas del evento por producto y bucket. Devuelve el payload columnar (ver el docstring del módulo)."""
+    finished = (now or datetime.now()) >= finished_at(event)
+    key = (event.id, bucket_minutes)
+    if finished:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    bucket_seconds = bucket_minutes * 60
+    engine = ENGINE if numpy is not None else 'sql'
+    cursor = session.connection().connection.cursor()
+    try:
+        aggregate = _aggregate_numpy if engine == 'numpy' else _aggregate_sql
+        buckets, products, quantity, revenue = aggregate(cursor, event.id, bucket_seconds)
+    finally:
+        cursor.close()
+
+    names = dict(session.execute(select(Product.id, Product.name).where(Product.id.in_(products))).all())
+    start = buckets[0] if buckets else None
+    payload = {
+        'event_id': event.id,
+        'bucket_minutes': bucket_minutes,
+        'start': (_EPOCH + timedelta(seconds=start * bucket_seconds)).isoformat() if buckets else None,
+        'buckets': [b - start for b in buckets],
+        'products': products,
+        'product_names': [names.get(p) for p in products],
+        'quantity': quantity,
+        'revenue': revenue,
+        'totals': {
+            'quantity': sum(map(sum, quantity)),
+            'revenue': round(sum(map(sum, revenue)), 2),
+        },
+        'finished': finished,
+        'engine': engine,
+    }
+
+    if finished:
+        with _cache_lock:
+            _cache[key] = payload
+            while len(_cache) > MAX_CACHED_EVENTS:
+                _cache.popitem(last=False)
+    return payload
@@ -0,0 +1,200 @@
+"""Acumulados de ventas por día, hora y evento para el dashboard admin.
+
+Las tablas `sales_rollup_day`, `sales_rollup_hour` y `sales_rollup_event` las
+mantienen triggers de SQLite sobre `orders` y `order_items`, así que se
+actualizan en la misma transacción que la compra (ORM o group commit), el
+canje (UPDATE condicional de app/claims.py) o el cambio de estado de Webpay.
+El dashboard lee unas pocas filas por clave primaria en vez de sumar la tabla
+de órdenes.
+
+Las órdenes CANCELLED no suman ventas: cuando una orden entra o sale de
+CANCELLED, el trigger mueve su total y sus ítems entre los contadores.
+Archivar un evento (app/order_archive.py) borra las filas del archivo
+principal pero no toca los acumulados, que siguen contando lo archivado.
+
+`rebuild` recalcula todo desde las órdenes (backfill) y `check` compara los
+acumulados con ese recálculo. Ambos se pueden correr con backfill_rollups.py.
+"""
+from datetime import date
+
+from sqlalchemy import event, func, select
+
+from .models import OrderItem, OrderStatus, SalesByDay, SalesByHour, SalesByEvent
+
+# (tabla, columna clave, expresión de la clave sobre una fila de orders)
+GRAINS = [
+    (SalesByDay.__tablename__, 'day', "substr({o}.created_at, 1, 10)"),
+    (SalesByHour.__tablename__, 'hour', "substr({o}.created_at, 1, 13)"),
+    (SalesByEvent.__tablename__, 'event_id', "{o}.event_id"),
+]
+
+MEASURES = ('order_count', 'revenue', 'items_sold', 'items_claimed', 'cancelled_count')
+
+# 1 si la orden cuenta como venta, 0 si está cancelada (estado guardado como nombre del enum)
+_LIVE = f"({{o}}.status IS NOT '{OrderStatus.CANCELLED.name}')"
+
+
+def _upsert(table, key, select):
+    columns = ', '.join(MEASURES)
+    updates = ', '.join(f"{m} = {m} + excluded.{m}" for m in MEASURES)
+    # El WHERE del SELECT evita que SQLite lea ON CONFLICT como parte de un JOIN
+    return f"INSERT INTO {table} ({key}, {columns}) {select} ON CONFLICT({key}) DO UPDATE SET {updates};"
+
+
+def _trigger_bodies(build_select):
+    return '\n'.join(
+        _upsert(table, key, build_select(bucket)) for table, key, bucket in GRAINS
+    )
+
+
+def _order_inserted(bucket):
+    live = _LIVE.format(o='new')
+    return (f"SELECT {bucket.format(o='new')}, {live}, new.total * {live}, 0, 0, 1 - {live} "
+            f"WHERE true")
+
+
+def _item_inserted(bucket):
+    live = _LIVE.format(o='o')
+    return (f"SELECT {bucket.format(o='o')}, 0, 0, new.quantity * {live}, coalesce(new.claimed, 0) * {live}, 0 "
+            f"FROM orders o WHERE o.order_id = new.order_id")
+
+
+def _item_updated(bucket):
+    live = _LIVE.format(o='o')
+    return (f"SELECT {bucket.format(o='o')}, 0, 0, (new.quantity - old.quantity) * {live}, "
+            f"(coalesce(new.claimed, 0) - coalesce(old.claimed, 0)) * {live}, 0 "
+            f"FROM orders o WHERE o.order_id = new.order_id")
+
+
+def _order_updated(bucket):
+    new_live, old_live = _LIVE.format(o='new'), _LIVE.format(o='old')
+    moved = f"({new_live} - {old_live})"
+    # Una sola fila aunque la orden no tenga ítems (agregado sin GROUP BY)
+    return (f"SELECT {bucket.format(o='new')}, {moved}, new.total * {new_live} - old.total * {old_live}, "
+            f"coalesce(sum(i.quantity), 0) * {moved}, coalesce(sum(i.claimed), 0) * {moved}, -{moved} "
+            f"FROM order_items i WHERE i.order_id = new.order_id")
+
+
+_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sales_rollup_order_ai AFTER INSERT ON orders BEGIN
+        {_trigger_bodies(_order_inserted)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sales_rollup_order_au AFTER UPDATE OF status, total ON orders
+    WHEN old.status IS NOT new.status OR old.total IS NOT new.total BEGIN
+        {_trigger_bodies(_order_updated)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sales_rollup_item_ai AFTER INSERT ON order_items BEGIN
+        {_trigger_bodies(_item_inserted)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS sales_rollup_item_au AFTER UPDATE OF quantity, claimed ON order_items
+    WHEN old.quantity IS NOT new.quantity OR old.claimed IS NOT new.claimed BEGIN
+        {_trigger_bodies(_item_updated)}
+    END
+    """,
+]
+
+
+def _recompute(connection):
+    """CTE con una fila por orden (principal y, si está adjunto, archivo frío) y sus ítems sumados."""
+    schemas = ['main']
+    if any(row[1] == 'cold' for row in connection.exec_driver_sql("PRAGMA database_list")):
+        schemas.append('cold')
+    orders = ' UNION ALL '.join(
+        f"SELECT order_id, event_id, created_at, total, status FROM {s}.orders" for s in schemas
+    )
+    items = ' UNION ALL '.join(
+        f"SELECT order_id, quantity, coalesce(claimed, 0) AS claimed FROM {s}.order_items" for s in schemas
+    )
+    live = _LIVE.format(o='o')
+    return (
+        f"WITH o AS ({orders}), "
+        f"i AS (SELECT order_id, sum(quantity) AS quantity, sum(claimed) AS claimed FROM ({items}) GROUP BY order_id), "
+        f"f AS (SELECT o.event_id, o.created_at, {live} AS live, {live} * o.total AS revenue, "
+        f"{live} * coalesce(i.quantity, 0) AS items_sold, {live} * coalesce(i.claimed, 0) AS items_claimed "
+        f"FROM o LEFT JOIN i ON i.order_id = o.order_id) "
+    )
+
+
+def _grouped(bucket):
+    return (f"SELECT {bucket.format(o='f')} AS bucket, sum(live) AS order_count, sum(revenue) AS revenue, "
+            f"sum(items_sold) AS items_sold, sum(items_claimed) AS items_claimed, sum(1 - live) AS cancelled_count "
+            f"FROM f GROUP BY bucket")
+
+
+def ensure_triggers(connection):
+    for ddl in _DDL:
+        connection.exec_driver_sql(ddl)
+
+
+def is_empty(connection):
+    return connection.exec_driver_sql(f"SELECT 1 FROM {GRAINS[0][0]} LIMIT 1").first() is None
+
+
+def rebuild(connection):
+    """Backfill: borra los acumulados y los recalcula desde todas las órdenes."""
+    for table, key, bucket in GRAINS:
+        connection.exec_driver_sql(f"DELETE FROM {table}")
+        connection.exec_driver_sql(
+            _recompute(connection)
+            + f"INSERT INTO {table} ({key}, {', '.join(MEASURES)}) {_grouped(bucket)}"
+        )
+
+
+def check(connection):
+    """Compara los acumulados con un recálculo completo. Devuelve {tabla: [filas]}, vacío si cuadran.
+
+    Cada bucket distinto aparece dos veces: como se esperaba ('expected') y como está guardado ('stored').
+    """
+    measures = ', '.join(f"round({m}, 2) AS {m}" if m == 'revenue' else m for m in MEASURES)
+    mismatches = {}
+    for table, key, bucket in GRAINS:
+        expected = f"SELECT bucket, {measures} FROM ({_grouped(bucket)})"
+        stored = f"SELECT {key}, {measures} FROM {table}"
+        # Filas en cero (p. ej. una orden que se canceló) equivalen a no tener fila
+        nonzero = ' OR '.join(f"{m} != 0" for m in MEASURES)
+        rows = connection.exec_driver_sql(
+            _recompute(connection)
+            + f", expected AS ({expected}), stored AS (SELECT * FROM ({stored}) WHERE {nonzero}) "
+            f"SELECT 'expected', * FROM (SELECT * FROM expected EXCEPT SELECT * FROM stored) "
+            f"UNION ALL SELECT 'stored', * FROM (SELECT * FROM stored EXCEPT SELECT * FROM expected)"
+        ).all()
+        if rows:
+            mismatches[table] = [tuple(row) for row in rows]
+    return mismatches
+
+
+def dashboard_counters(executor, today=None):
+    """Ventas del mes y tickets vendidos hoy (Session o Connection): a lo más 32 filas por clave primaria."""
+    today = today or date.today()
+    sales_month = executor.execute(
+        select(func.sum(SalesByDay.revenue)).where(SalesByDay.day >= today.replace(day=1).isoformat())
+    ).scalar()
+    tickets_today = executor.execute(
+        select(SalesByDay.items_sold).where(SalesByDay.day == today.isoformat())
+    ).scalar()
+    return {
+        'sales_month': float(sales_month) if sales_month else 0.0,
+        'tickets_sold_today': int(tickets_today) if tickets_today else 0,
+    }
+
+
+def event_progress(executor, event_id):
+    """Unidades vendidas y canjeadas del evento, desde su fila de sales_rollup_event."""
+    row = executor.execute(
+        select(SalesByEvent.items_sold, SalesByEvent.items_claimed).where(SalesByEvent.event_id == event_id)
+    ).one_or_none()
+    return {'items_sold': row.items_sold if row else 0, 'items_claimed': row.items_claimed if row else 0}
+
+
+@event.listens_for(OrderItem.__table__, 'after_create')
+def _create_triggers(target, connection, **kw):
+    # create_all (populate / reset-db) recrea orders y order_items sin triggers; order_items se crea
+    # después de orders (FK), así que ambas tablas ya existen
+    ensure_triggers(connection)
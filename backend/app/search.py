@@ -0,0 +1,130 @@
+"""Índice de búsqueda FTS5 sobre el catálogo de productos.
+
+`product_search` es una tabla virtual FTS5 (rowid = products.id) con el
+nombre, la descripción y el nombre de la categoría de cada producto. Se
+mantiene sincronizada con triggers de SQLite, así que también cubre los
+INSERT/UPDATE masivos que no pasan por el ORM.
+
+El tokenizer `unicode61 remove_diacritics 2` hace que "cusquena" encuentre
+"Cusqueña", y los símbolos como "°" actúan de separador ("Pisco 40°").
+"""
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from .models import Product
+
+# Pesos bm25 por columna: name, description, category_name
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        name, description, category_name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON products BEGIN
+        DELETE FROM product_search WHERE rowid = new.id;
+        INSERT INTO product_search (rowid, name, description, category_name)
+        VALUES (new.id, new.name, new.description,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE ON products BEGIN
+        DELETE FROM product_search WHERE rowid = old.id;
+        INSERT INTO product_search (rowid, name, description, category_name)
+        VALUES (new.id, new.name, new.description,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON products BEGIN
+        DELETE FROM product_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_cu AFTER UPDATE OF name ON categories BEGIN
+        UPDATE product_search SET category_name = new.name
+        WHERE rowid IN (SELECT id FROM products WHERE category_id = new.id);
+    END
+    """,
+]
+
+_REBUILD = [
+    "DELETE FROM product_search",
+    """
+    INSERT INTO product_search (rowid, name, description, category_name)
+    SELECT p.id, p.name, p.description, c.name
+    FROM products p LEFT JOIN categories c ON c.id = p.category_id
+    """,
+]
+
+available = True
+
+
+def ensure_index(connection, rebuild=False):
+    """Crea la tabla virtual y los triggers si faltan, y la reconstruye si quedó desfasada."""
+    global available
+    try:
+        for ddl in _DDL:
+            connection.exec_driver_sql(ddl)
+    except OperationalError:
+        # SQLite compilado sin FTS5: la búsqueda cae a LIKE (ver search_products)
+        available = False
+        return
+
+    if not rebuild:
+        indexed = connection.exec_driver_sql("SELECT count(*) FROM product_search").scalar()
+        products = connection.exec_driver_sql("SELECT count(*) FROM products").scalar()
+        rebuild = indexed != products
+    if rebuild:
+        for stmt in _REBUILD:
+            connection.exec_driver_sql(stmt)
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def _create_index(target, connection, **kw):
+    # create_all (populate / reset-db) recrea products sin triggers: los volvemos a crear
+    ensure_index(connection, rebuild=True)
+
+
+@event.listens_for(Product.__table__, 'after_drop')
+def _drop_index(target, connection, **kw):
+    connection.exec_driver_sql("DROP TABLE IF EXISTS product_search")
+
+
+def match_expression(query):
+    """Convierte el texto del usuario en una expresión MATCH segura con búsqueda por prefijo."""
+    terms = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def search_products(session, query, limit, offset):
+    """Devuelve [(product_id, score)] ordenados por relevancia (menor score = mejor)."""
+    if not available:
+        pattern = f"%{query}%"
+        rows = session.execute(text(
+            "SELECT p.id, 0 FROM products p LEFT JOIN categories c ON c.id = p.category_id "
+            "WHERE p.name LIKE :p OR p.description LIKE :p OR c.name LIKE :p "
+            "ORDER BY p.id LIMIT :limit OFFSET :offset"
+        ), {'p': pattern, 'limit': limit, 'offset': offset})
+        return rows.all()
+
+    expression = match_expression(query)
+    if not expression:
+        return []
+    rows = session.execute(text(
+        "SELECT rowid, bm25(product_search, :w_name, :w_desc, :w_cat) AS score "
+        "FROM product_search WHERE product_search MATCH :q "
+        "ORDER BY score LIMIT :limit OFFSET :offset"
+    ), {
+        'q': expression,
+        'w_name': RANK_WEIGHTS[0], 'w_desc': RANK_WEIGHTS[1], 'w_cat': RANK_WEIGHTS[2],
+        'limit': limit, 'offset': offset,
+    })
+    return rows.all()
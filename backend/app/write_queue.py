@@ -0,0 +1,109 @@
+"""Group commit opcional para las inserciones de órdenes (ORDER_GROUP_COMMIT=1).
+
+Con un único archivo SQLite, cada checkout que hace su propio commit compite por
+el lock de escritura y, en el peak del intermedio, falla con "database is
+locked". Con el coalescer activo, las requests encolan su inserción y un hilo
+de este worker las junta durante unos milisegundos (ORDER_GROUP_COMMIT_WINDOW_MS)
+y las confirma en una sola transacción: un lock y un fsync por lote.
+
+Cada request recibe su propio resultado o error. Si el lote falla (p. ej. un
+order_id duplicado), se hace rollback y sus trabajos se reintentan uno por uno
+en transacciones separadas, así el error queda solo en la request culpable.
+Los trabajos deben ser funciones `job(connection)` que solo escriben y pueden
+reejecutarse.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import db
+
+MAX_BATCH = 200
+RESULT_TIMEOUT = 30
+
+
+class GroupCommitQueue:
+    def __init__(self, window_ms=5, max_batch=MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.enabled = False
+        self.batches = 0
+        self.jobs = 0
+        self.fallbacks = 0
+        self._engine = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, enabled=False):
+        self.enabled = enabled
+        if enabled:
+            with app.app_context():
+                self._engine = db.engine
+
+    def run(self, job):
+        """Ejecuta `job(connection)` dentro de un lote y devuelve su resultado (o relanza su error)."""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((job, future))
+        return future.result(timeout=RESULT_TIMEOUT)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name='order-group-commit', daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.jobs += len(batch)
+            try:
+                with self._engine.begin() as connection:
+                    results = [job(connection) for job, _ in batch]
+            except Exception:
+                self.fallbacks += 1
+                self._run_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_one_by_one(self, batch):
+        for job, future in batch:
+            try:
+                with self._engine.begin() as connection:
+                    result = job(connection)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'window_ms': self.window * 1000,
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'avg_batch': round(self.jobs / self.batches, 2) if self.batches else None,
+            'fallbacks': self.fallbacks,
+        }
+
+
+order_writes = GroupCommitQueue(window_ms=float(os.getenv('ORDER_GROUP_COMMIT_WINDOW_MS', 5)))
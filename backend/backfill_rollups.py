@@ -0,0 +1,40 @@
+"""Backfill y verificación de los acumulados de ventas del dashboard.
+
+Los acumulados (app/sales_rollups.py) los mantienen triggers de SQLite. Este
+script los recalcula desde cero a partir de las órdenes (incluidas las del
+archivo frío si ORDER_ARCHIVE=1), o solo los compara con ese recálculo.
+Con --check termina con código 1 si algún acumulado no cuadra.
+
+Uso (desde backend/):
+    python backfill_rollups.py           # recalcula
+    python backfill_rollups.py --check   # solo verifica
+"""
+import sys
+
+from app import create_app, db
+from app import sales_rollups
+
+
+def main(argv):
+    app = create_app()
+    with app.app_context():
+        if '--check' not in argv:
+            with db.engine.begin() as connection:
+                sales_rollups.rebuild(connection)
+            print('Acumulados recalculados')
+
+        with db.engine.connect() as connection:
+            mismatches = sales_rollups.check(connection)
+
+    if mismatches:
+        for table, rows in mismatches.items():
+            print(f'{table}: {len(rows)} diferencia(s)')
+            for row in rows[:20]:
+                print(f'  {row}')
+        return 1
+    print('OK: los acumulados cuadran con las órdenes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
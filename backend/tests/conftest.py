@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+
+import pytest
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def db_path(tmp_path_factory):
+    # Copia de backend/sqlite.db: las pruebas escriben (órdenes, canjes) y no deben tocar la base del repo
+    path = tmp_path_factory.mktemp('db') / 'sqlite.db'
+    shutil.copy(os.path.join(BACKEND_DIR, 'sqlite.db'), path)
+    return path
+
+
+@pytest.fixture(scope='session')
+def app(db_path):
+    os.environ['DATABASE_PATH'] = str(db_path)
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    """Lista de (engine, statement, parameters) de cada SELECT ejecutado, en todos los engines."""
+    from app import db
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((conn.engine, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', capture)
+    yield captured
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', capture)
@@ -0,0 +1,76 @@
+"""La exportación de órdenes se transmite: el pico de memoria no crece con el tamaño del evento.
+
+Genera un evento grande en una copia de la base y corre la exportación en un
+proceso aparte, para que ru_maxrss (pico del proceso) no arrastre lo que
+usaron otras pruebas. Se compara el pico antes y después de leer la respuesta
+completa, que pesa más que el límite. El mmap y la caché de páginas de SQLite
+(app/db_profile.py) se achican en ese proceso: si no, el pico mide cuánto del
+archivo se leyó y no lo que retiene la exportación.
+"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+ORDERS = 25_000
+ITEMS_PER_ORDER = 8
+EVENT_ID = 1
+RSS_LIMIT_MB = 20
+
+_EXPORT = '''
+import resource, sys
+from app import create_app
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KiB
+
+client = create_app().test_client()
+# Calentamiento: importa y prepara todo lo que la exportación usa, con un filtro que no trae filas
+b''.join(client.get('/api/orders/export?event_id=-1', buffered=False).response)
+
+before = peak_mb()
+response = client.get(sys.argv[1], buffered=False)
+size = sum(len(chunk) for chunk in response.response)
+print(response.status_code, size, before, peak_mb())
+'''
+
+
+@pytest.fixture(scope='module')
+def large_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp('export') / 'sqlite.db'
+    shutil.copy(os.path.join(BACKEND_DIR, 'sqlite.db'), path)
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO orders (order_id, user_id, event_id, iso_date, purchase_time, total, status, created_at) "
+            "VALUES (?, 'export-user', ?, '2026-01-10', '22:15:00.000000', 36000, 'COMPLETED', ?)",
+            ((f'EXP-{n:06d}', EVENT_ID, f'2026-01-10 22:{n // 1000 % 60:02d}:{n % 60:02d}.{n:06d}')
+             for n in range(ORDERS)),
+        )
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, product_name, quantity, claimed, price_at_purchase) "
+            "VALUES (?, 1, 'Cerveza artesanal de la casa 500cc', 1, 0, 4500)",
+            ((f'EXP-{n:06d}',) for n in range(ORDERS) for _ in range(ITEMS_PER_ORDER)),
+        )
+    return path
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+def test_export_peak_rss_is_bounded(large_db, export_format):
+    env = dict(os.environ, DATABASE_PATH=str(large_db), LIVE_EVENTS='0',
+               SQLITE_MMAP_SIZE_MB='0', SQLITE_CACHE_SIZE_KB='2000')
+    url = f'/api/orders/export?event_id={EVENT_ID}&format={export_format}'
+    result = subprocess.run([sys.executable, '-c', _EXPORT, url], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    status, size, before, after = result.stdout.split()[-4:]
+    size_mb = int(size) / 2**20
+    growth = float(after) - float(before)
+    assert status == '200'
+    assert size_mb > RSS_LIMIT_MB, f'la exportación pesa solo {size_mb:.1f} MB: no prueba el límite'
+    assert growth < RSS_LIMIT_MB, f'{export_format}: {size_mb:.0f} MB exportados, el pico de RSS creció {growth:.0f} MB'
@@ -0,0 +1,67 @@
+"""Los listados cargan sus relaciones con un número fijo de consultas (sin N+1).
+
+Cada listado se cuenta sobre la base de prueba y de nuevo después de agregar
+menús, categorías, productos y órdenes: el número de consultas no debe cambiar.
+"""
+from datetime import date, datetime, time
+
+import pytest
+
+from app import db
+from app.models import Category, Event, Menu, MenuProduct, Order, OrderItem, OrderStatus, Product, User
+
+USER_ID = 'query-count-user'
+
+# Listado -> consultas esperadas (ver las opciones de carga en catalog_routes.py y order_routes.py)
+LISTINGS = {
+    '/api/catalog/menus': 1,
+    '/api/catalog/menus/{menu_id}': 2,
+    '/api/catalog/categories': 2,
+    '/api/catalog/products': 1,
+    '/api/orders/': 2,
+    '/api/orders/my-history': 2,
+}
+
+
+def _add_rows(app, n):
+    """Agrega n categorías con productos, n menús con esos productos (y al primer menú) y n órdenes con ítems."""
+    with app.app_context():
+        if db.session.get(User, USER_ID) is None:
+            db.session.add(User(id=USER_ID, name='Query Count', email=f'{USER_ID}@example.com'))
+        event = db.session.get(Event, 1)
+        first_menu = Menu.query.order_by(Menu.id).first()
+        for i in range(n):
+            category = Category(name=f'QC categoría {datetime.utcnow().timestamp()}-{i}')
+            products = [Product(name=f'QC producto {i}-{j}', price=1000, category=category) for j in range(3)]
+            menu = Menu(name=f'QC menú {i}', event_id=event.id)
+            db.session.add_all([category, menu, *products])
+            db.session.flush()
+            db.session.add_all(MenuProduct(menu_id=m.id, product_id=p.id, price=p.price)
+                               for m in (menu, first_menu) for p in products)
+
+            order = Order(
+                order_id=f'QC-{datetime.utcnow().timestamp()}-{i}', user_id=USER_ID, event_id=event.id,
+                iso_date=date.today(), purchase_time=time(12, 0), total=3000, status=OrderStatus.COMPLETED,
+            )
+            order.items = [OrderItem(product_id=p.id, product_name=p.name, quantity=1, claimed=0,
+                                     price_at_purchase=p.price) for p in products]
+            db.session.add(order)
+        db.session.commit()
+        return first_menu.id
+
+
+def _count(client, queries, url):
+    queries.clear()
+    response = client.get(url, headers={'Authorization': f'Bearer dummy-jwt-token-for-{USER_ID}'})
+    assert response.status_code == 200, response.data[:200]
+    return len(queries)
+
+
+@pytest.mark.parametrize('url', LISTINGS)
+def test_listing_query_count_is_constant(app, client, queries, url):
+    menu_id = _add_rows(app, 2)
+    small = _count(client, queries, url.format(menu_id=menu_id))
+    _add_rows(app, 25)
+    large = _count(client, queries, url.format(menu_id=menu_id))
+
+    assert small == large == LISTINGS[url], f'GET {url}: {small} consultas, luego {large} con más filas'
@@ -0,0 +1,129 @@
+"""Las consultas calientes deben usar índices: falla con un SCAN de tabla o un TEMP B-TREE.
+
+Cada caso llama un endpoint con el cliente de pruebas, captura los SELECT que
+emite (en el engine principal y en el de solo lectura) y revisa su EXPLAIN
+QUERY PLAN en el mismo engine que los ejecutó.
+
+Un TEMP B-TREE que ordena el resultado de una subconsulta (las ramas con LIMIT
+de la actividad, la página de órdenes) está acotado y no cuenta. Las demás
+excepciones se declaran por endpoint en ALLOWED_SCANS / ALLOWED_SORTS.
+"""
+import re
+
+import pytest
+
+from app import db
+from app.models import Order, OrderItem, OrderStatus, User, Role
+
+# Un SCAN sobre un índice (covering) o sobre la tabla virtual FTS5 no es un recorrido de tabla
+FULL_SCAN = re.compile(r'\bSCAN (\w+)\b(?! USING (COVERING )?INDEX)(?! VIRTUAL TABLE)')
+TEMP_BTREE = re.compile(r'USE TEMP B-TREE FOR (.+)')
+# Resultado de una subconsulta (p. ej. cada rama con LIMIT del UNION ALL de actividad): no es una tabla
+SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+ACCESS = re.compile(r'^(?:SCAN|SEARCH) (\w+)')
+
+HOT_REQUESTS = [
+    '/api/catalog/events?public=true',
+    '/api/catalog/events?public=true&filter_type=featured',
+    '/api/catalog/events?public=true&time_filter=week',
+    '/api/catalog/events?public=true&date_from=2025-01-01&date_to=2025-12-31',
+    '/api/catalog/events/featured',
+    '/api/catalog/events/{event_id}',
+    '/api/catalog/events/{event_id}/menu',
+    '/api/catalog/products/search?q=cerveza',
+    '/api/stats/dashboard',
+    '/api/stats/activity?limit=5',
+    '/api/stats/activity?limit=5&after={activity_cursor}',
+    '/api/orders/?event_id={event_id}',
+    '/api/orders/?status=COMPLETED',
+    '/api/orders/?event_id={event_id}&status=COMPLETED&date_from=2020-01-01&date_to=2100-12-31',
+    '/api/orders/?event_id={event_id}&limit=5',
+    '/api/orders/?status=COMPLETED&limit=5&after={order_cursor}',
+    '/api/orders/export?event_id={event_id}',
+    '/api/orders/export?format=csv&status=COMPLETED&date_from=2020-01-01',
+    '/api/orders/{order_id}',
+    '/api/orders/my-history',
+    '/api/users/me',
+    '/api/users/',
+    '/api/claims/events/{event_id}/manifest',
+    '/api/claims/events/{event_id}/manifest/changes?since=0',
+]
+
+# Listados completos por contrato (sin filtro ni paginación): recorren la tabla a propósito
+ALLOWED_SCANS = {
+    '/api/users/': {'users'},
+}
+
+# RIGHT PART: el índice entrega las órdenes en orden y solo se ordenan los ítems de cada una.
+# La búsqueda ordena por relevancia (bm25), que ningún índice puede entregar.
+ALLOWED_SORTS = {
+    '/api/orders/export?event_id={event_id}': {'RIGHT PART OF ORDER BY'},
+    '/api/orders/export?format=csv&status=COMPLETED&date_from=2020-01-01': {'RIGHT PART OF ORDER BY'},
+    '/api/claims/events/{event_id}/manifest': {'RIGHT PART OF ORDER BY'},
+    '/api/catalog/products/search?q=cerveza': {'ORDER BY'},
+}
+
+
+@pytest.fixture(scope='module')
+def hot_data(app):
+    client = app.test_client()
+    with app.app_context():
+        order = Order.query.filter(Order.status == OrderStatus.COMPLETED).first()
+        scanner = User.query.filter(User.role.in_((Role.scanner, Role.admin))).first()
+        data = {
+            'event_id': order.event_id,
+            'order_id': order.order_id,
+            'user_auth': f'Bearer dummy-jwt-token-for-{order.user_id}',
+            'scanner_auth': f'Bearer dummy-jwt-token-for-{scanner.id}',
+        }
+        # Un ítem nuevo deja una fila en manifest_changes: /changes?since=0 consulta la tabla, no sale antes
+        item = order.items[0]
+        db.session.add(OrderItem(order_id=order.order_id, product_id=item.product_id, product_name=item.product_name,
+                                 quantity=1, claimed=0, price_at_purchase=item.price_at_purchase))
+        db.session.commit()
+    data['order_cursor'] = client.get('/api/orders/?status=COMPLETED&limit=2').get_json()['next_after']
+    data['activity_cursor'] = client.get('/api/stats/activity?limit=2').get_json()['next_after']
+    return data
+
+
+def _sorts_subquery(plan, parent, subqueries):
+    # La primera tabla que lee ese SELECT (la que lo conduce) es el resultado de una subconsulta
+    for _, node_parent, detail in plan:
+        access = ACCESS.match(detail)
+        if node_parent == parent and access:
+            return access.group(1) in subqueries
+    return False
+
+
+def plan_problems(engine, statement, parameters, allowed_scans=(), allowed_sorts=()):
+    with engine.connect() as conn:
+        plan = [tuple(row[:2]) + (row[-1],)
+                for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    subqueries = {m.group(1) for m in (SUBQUERY.match(detail) for _, _, detail in plan) if m}
+    problems = []
+    for _, parent, detail in plan:
+        scan = FULL_SCAN.search(detail)
+        sort = TEMP_BTREE.search(detail)
+        if scan and scan.group(1) not in subqueries and scan.group(1) not in allowed_scans:
+            problems.append(detail)
+        elif sort and sort.group(1) not in allowed_sorts and not _sorts_subquery(plan, parent, subqueries):
+            problems.append(detail)
+    return problems, [detail for _, _, detail in plan]
+
+
+@pytest.mark.parametrize('url', HOT_REQUESTS)
+def test_hot_queries_use_indexes(client, queries, hot_data, url):
+    allowed_scans, allowed_sorts = ALLOWED_SCANS.get(url, ()), ALLOWED_SORTS.get(url, ())
+    url = url.format(**hot_data)
+    auth = hot_data['scanner_auth'] if '/api/claims/' in url else hot_data['user_auth']
+    response = client.get(url, headers={'Authorization': auth})
+    assert response.status_code == 200, response.data[:200]
+    response.get_data()  # consume los endpoints que transmiten (export)
+    assert queries, f'{url} no ejecutó consultas'
+
+    failures = []
+    for engine, statement, parameters in queries:
+        problems, plan = plan_problems(engine, statement, parameters, allowed_scans, allowed_sorts)
+        if problems:
+            failures.append(f'{"; ".join(problems)}\n  {" ".join(statement.split())[:300]}\n  plan: {plan}')
+    assert not failures, f'GET {url}:\n' + '\n'.join(failures)